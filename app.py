@@ -10,20 +10,32 @@ from io import StringIO, BytesIO
 import csv
 from dotenv import load_dotenv
 import bcrypt
-import pathlib
+import secrets
+import threading
+import traceback
+from concurrent.futures import TimeoutError as EncodeTimeout
 from recommendation_engine import RecommendationEngine
+from vector_store import VectorStore, FAISS_AVAILABLE
+from embedding_cache import EmbeddingCache
+from query_encoder import BatchingEncoder, QueueFullError
+from lru_cache import LRUCache, normalize_query
+from index_jobs import IndexBuildJobs, BuildAlreadyRunning
+from language import detect_language, localize, LANGUAGES
+from suggest_index import SuggestIndex
+from catalog_cache import CatalogCache
+from category_view import CategoryView
+from engagement_writer import EngagementWriter, IngestQueueFullError
+from db_indexes import ensure_indexes
+from engagement_rollups import EngagementRollups
+from engagement_counters import EngagementCounters, AGE_GROUPS
+from swr_cache import StaleWhileRevalidate
+from engagement_sketches import EngagementSketches
+from lexical_index import BM25Index, confident, reciprocal_rank_fusion, PathLatency
 
 # AI / embeddings
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
-# faiss may not be present on every host — allow fallback
-try:
-    import faiss
-    FAISS_AVAILABLE = True
-except Exception:
-    FAISS_AVAILABLE = False
-
 load_dotenv()
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
@@ -44,22 +56,48 @@ users_col = db["users"]  # new: progressive profile / accounts
 products_col = db["products"]
 orders_col = db["orders"]
 payments_col = db["payments"]
+meta_col = db["meta"]  # small bookkeeping docs (catalog version)
+category_view_col = db["category_view"]  # materialized categories + embedded ministries (category_view.py)
+rollup_col = db["engagement_rollups"]  # hourly / daily engagement counts (engagement_rollups.py)
+counters_col = db["engagement_counters"]  # per-day insight counters (engagement_counters.py)
+sketches_col = db["engagement_sketches"]  # per-day HyperLogLog / Count-Min sketches (engagement_sketches.py)
+
+# indexes for every hot query (see db_indexes.py); idempotent, so safe on every start
+if os.getenv("MONGO_ENSURE_INDEXES", "1") == "1":
+    try:
+        ensure_indexes(db)
+    except Exception as e:
+        print(f"⚠️ Could not ensure Mongo indexes: {e}")
 
 # Initialize Recommendation Engine
 recommendation_engine = RecommendationEngine()
 
-# Embedding model (lazy-init)
-EMBED_MODEL = None
-INDEX_PATH = pathlib.Path("./data/faiss.index")
-META_PATH = pathlib.Path("./data/faiss_meta.json")
-VECTOR_DIM = 384  # for all-MiniLM-L6-v2
-
-
-def get_embedding_model():
-    global EMBED_MODEL
-    if EMBED_MODEL is None:
-        EMBED_MODEL = SentenceTransformer(os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2"))
-    return EMBED_MODEL
+# Embedding models (lazy-init). English uses EMBED_MODEL; Sinhala / Tamil need a model
+# that actually understands those scripts, so they default to a multilingual one.
+EMBED_MODEL_NAME = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+MULTILINGUAL_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+SEARCH_LANGUAGES = [l.strip() for l in os.getenv("SEARCH_LANGUAGES", "en,si,ta").split(",") if l.strip()]
+LANGUAGE_MODELS = {
+    "en": EMBED_MODEL_NAME,
+    "si": os.getenv("EMBED_MODEL_SI", MULTILINGUAL_MODEL_NAME),
+    "ta": os.getenv("EMBED_MODEL_TA", MULTILINGUAL_MODEL_NAME),
+}
+EMBED_MODELS = {}  # model name -> SentenceTransformer
+# catalog vectors keyed by content hash, so rebuilds only encode new/edited questions
+embedding_caches = {name: EmbeddingCache(name, "data/embed_cache") for name in set(LANGUAGE_MODELS.values())}
+# one index shard per language (data/index, data/index_si, ...); each stays resident and is
+# reloaded only when its files on disk change. A query only searches its own language's shard.
+vector_stores = {
+    lang: VectorStore("data", "index" if lang == "en" else f"index_{lang}", legacy=lang == "en")
+    for lang in SEARCH_LANGUAGES
+}
+
+
+def get_embedding_model(lang="en"):
+    name = LANGUAGE_MODELS.get(lang, EMBED_MODEL_NAME)
+    if name not in EMBED_MODELS:
+        EMBED_MODELS[name] = SentenceTransformer(name)
+    return EMBED_MODELS[name]
 
 
 # --- Helpers ---
@@ -93,55 +131,180 @@ def manage_page():
 
 
 # --- API: services & categories (public) ---
+# responses are cached per catalog version; admin writes bump it (see catalog_changed)
+catalog_cache = CatalogCache(meta_col, check_interval=float(os.getenv("CATALOG_VERSION_CHECK", 2)))
+
+
+def catalog_response(key, build_fn):
+    """
+    Serve build_fn()'s JSON from the catalog cache, answering If-None-Match with 304.
+    ?lang=en|si|ta keeps one language per text field; gzip bodies are built once per version.
+    """
+    lang = request.args.get("lang")
+    if lang in LANGUAGES:
+        key = key + (lang,)
+        build = lambda: localize(build_fn(), lang)
+    else:
+        build = build_fn
+    version = catalog_cache.version()
+    etag = catalog_cache.etag(key, version)
+    # the gzipped and plain bodies are different bytes, so they get different strong ETags
+    matched = next((tag for tag in (etag + "-gz", etag) if request.if_none_match.contains(tag)), None)
+    if matched:
+        resp = app.response_class(status=304)
+        etag = matched
+    else:
+        body = catalog_cache.body(key, version, lambda: app.json.dumps(build()).encode("utf-8"))
+        if "gzip" in request.headers.get("Accept-Encoding", "") and body.gzipped is not None:
+            resp = app.response_class(body.gzipped, mimetype="application/json")
+            resp.headers["Content-Encoding"] = "gzip"
+            etag += "-gz"
+        else:
+            resp = app.response_class(body.data, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = "no-cache"  # always revalidate; unchanged catalog -> 304
+    return resp
+
+
+def bump_catalog():
+    try:
+        return catalog_cache.bump()
+    except Exception:
+        # the write itself succeeded; caches catch up on the next successful bump
+        return None
+
+
+def catalog_changed(service_id=None):
+    """After an admin write: refresh the category view (one service or all), then bump the version"""
+    try:
+        if service_id is None:
+            category_view.rebuild()
+        else:
+            category_view.service_changed(service_id)
+    except Exception:
+        traceback.print_exc()
+    return bump_catalog()
+
+
 @app.route("/api/services")
 def get_services():
-    docs = list(services_col.find({}, {"_id": 0}))
-    return jsonify(docs)
+    return catalog_response(("services",), lambda: list(services_col.find({}, {"_id": 0})))
+
+
+category_view = CategoryView(services_col, categories_col, category_view_col)
 
 
 @app.route("/api/categories")
 def get_categories():
-    # categories collection contains category documents: {id, name:{en,si,ta}, ministries:[id,...]}
-    cats = list(categories_col.find({}, {"_id": 0}))
-    # if not seeded, create dynamic categories from existing services grouped by service.category
-    if not cats:
-        pipeline = [
-            {"$project": {"id": 1, "name": 1, "category": 1, "subservices": 1}},
-            {"$group": {"_id": "$category", "ministries": {"$push": {"id": "$id", "name": "$name"}}}}
-        ]
-        try:
-            groups = list(services_col.aggregate(pipeline))
-            cats = [{"id": g["_id"] or "uncategorized", "name": {"en": g["_id"] or "Uncategorized"}, "ministries": g["ministries"]} for g in groups]
-        except Exception:
-            cats = []
-    return jsonify(cats)
+    # {id, name:{en,si,ta}, ministries:[{id, name, subservice_count, subservices:[{id, name}]}], ...}
+    return catalog_response(("categories",), category_view.read)
 
 
 @app.route("/api/service/<service_id>")
 def get_service(service_id):
-    doc = services_col.find_one({"id": service_id}, {"_id": 0})
-    return jsonify(doc or {})
+    return catalog_response(("service", service_id), lambda: services_col.find_one({"id": service_id}, {"_id": 0}) or {})
 
 
 # Autosuggest search (quick matches for typeahead)
+# prefix index over service/subservice names in en/si/ta (+ typo correction); rebuilt after admin
+# edits in any worker (keyed on the shared catalog version)
+suggest_index = SuggestIndex(
+    lambda: services_col.find({}, {"_id": 0, "id": 1, "name": 1, "subservices": 1}),
+    max_age=int(os.getenv("SUGGEST_MAX_AGE", 300)),
+    max_distance=int(os.getenv("SUGGEST_MAX_EDIT", 2)),
+    version_fn=catalog_cache.version,
+)
+
+
+SUGGEST_LIMIT = int(os.getenv("SUGGEST_LIMIT", 8))
+SUGGEST_MAX_BYTES = int(os.getenv("SUGGEST_MAX_BYTES", 1024))
+
+
 @app.route("/api/search/autosuggest")
 def autosuggest():
+    """
+    ?q=...&lang=en|si|ta -> [{"id", "sub"?, "name", "match", "hl": [[start, end]]}, ...]
+    Items only carry what the dropdown shows; the client fetches the service on pick.
+    """
     q = request.args.get("q", "").strip()
     if not q:
         return jsonify([])
-    # simple text search across service names and subservice names
-    regex = {"$regex": q, "$options": "i"}
-    results = []
-    for s in services_col.find({"$or": [{"name.en": regex}, {"subservices.name.en": regex}]}, {"_id": 0, "id": 1, "name": 1, "subservices": 1}).limit(20):
-        results.append(s)
-    return jsonify(results)
+    lang = request.args.get("lang", "en")
+    # compact JSON, cut off at SUGGEST_MAX_BYTES (whole items only)
+    parts = []
+    size = 2
+    for item in suggest_index.suggest(q[:100], SUGGEST_LIMIT, lang):
+        part = json.dumps(item, ensure_ascii=False, separators=(",", ":"))
+        size += len(part.encode("utf-8")) + 1
+        if parts and size > SUGGEST_MAX_BYTES:
+            break
+        parts.append(part)
+    return app.response_class("[" + ",".join(parts) + "]", mimetype="application/json")
 
 
 # Engagement logging (extended to include ad clicks / profile step)
-@app.route("/api/engagement", methods=["POST"])
-def log_engagement():
-    payload = request.json or {}
-    doc = {
+# events are queued and written in batches off the request thread; see engagement_writer.py
+engagement_writer = EngagementWriter(
+    eng_col,
+    batch_size=int(os.getenv("ENGAGEMENT_BATCH_SIZE", 500)),
+    flush_interval=float(os.getenv("ENGAGEMENT_FLUSH_MS", 1000)) / 1000.0,
+    max_queue=int(os.getenv("ENGAGEMENT_QUEUE_MAX", 50000)),
+    spill_path=os.getenv("ENGAGEMENT_SPILL_PATH", "data/engagement_spill.jsonl")
+)
+
+
+# analytics read these rollups. Raw events expire after ENGAGEMENT_TTL_DAYS (0 = never),
+# but the TTL index is only added once the rollups and the counter backfill have caught up
+engagement_rollups = EngagementRollups(
+    eng_col, rollup_col, meta_col,
+    ttl_days=float(os.getenv("ENGAGEMENT_TTL_DAYS", 90)),
+    ttl_ready=lambda: engagement_counters.history_complete(eng_col),
+    lag_hours=float(os.getenv("ENGAGEMENT_ROLLUP_LAG_HOURS", 6)),  # late events still counted
+)
+ENGAGEMENT_ROLLUP_INTERVAL = float(os.getenv("ENGAGEMENT_ROLLUP_INTERVAL", 300))  # seconds; 0 = external cron
+
+
+@app.before_request
+def start_background_jobs():
+    # started with the first request, so importing app (seed_data.py, scripts) runs no jobs
+    if ENGAGEMENT_ROLLUP_INTERVAL > 0:
+        engagement_rollups.start(ENGAGEMENT_ROLLUP_INTERVAL)
+
+
+# per-day insight counters, bumped as events are accepted (not re-derived from raw events)
+engagement_counters = EngagementCounters(
+    counters_col, flush_interval=float(os.getenv("COUNTERS_FLUSH_SECONDS", 5)), meta_col=meta_col
+)
+
+
+# approximate unique users / sessions and heavy hitters in constant memory per day
+engagement_sketches = EngagementSketches(
+    sketches_col,
+    p=int(os.getenv("SKETCH_HLL_P", 14)),
+    width=int(os.getenv("SKETCH_CMS_WIDTH", 2048)),
+    depth=int(os.getenv("SKETCH_CMS_DEPTH", 5)),
+    k=int(os.getenv("SKETCH_TOP_K", 64)),
+    flush_interval=float(os.getenv("SKETCH_FLUSH_SECONDS", 30)),
+)
+
+
+def submit_engagements(docs):
+    engagement_writer.submit_many(docs)
+    engagement_counters.add(docs)
+    engagement_sketches.add(docs)
+
+
+def queue_engagements(docs):
+    try:
+        submit_engagements(docs)
+    except IngestQueueFullError:
+        return jsonify({"error": "too many events, please retry"}), 503
+    return jsonify({"status": "ok"})
+
+
+def engagement_doc(payload):
+    return {
         "user_id": payload.get("user_id") or None,
         "age": int(payload.get("age")) if payload.get("age") else None,
         "job": payload.get("job"),
@@ -152,8 +315,44 @@ def log_engagement():
         "source": payload.get("source"),
         "timestamp": datetime.utcnow()
     }
-    eng_col.insert_one(doc)
-    return jsonify({"status": "ok"})
+
+
+@app.route("/api/engagement", methods=["POST"])
+def log_engagement():
+    payload = request.json or {}
+    return queue_engagements([engagement_doc(payload)])
+
+
+ENGAGEMENT_BATCH_MAX = int(os.getenv("ENGAGEMENT_BATCH_MAX", 200))
+
+
+@app.route("/api/engagement/batch", methods=["POST"])
+def log_engagement_batch():
+    """
+    Accepts [event, ...] or {"events": [...]}, also as text/plain so navigator.sendBeacon
+    works without a preflight. Events with "kind": "enhanced" are normalized like
+    /api/engagement/enhanced, the rest like /api/engagement; the batch is queued in one go.
+    """
+    payload = request.get_json(force=True, silent=True)
+    events = payload.get("events") if isinstance(payload, dict) else payload
+    if not isinstance(events, list):
+        return jsonify({"error": "expected a list of events"}), 400
+    if len(events) > ENGAGEMENT_BATCH_MAX:
+        return jsonify({"error": f"at most {ENGAGEMENT_BATCH_MAX} events per batch"}), 413
+    docs = []
+    rejected = 0
+    for event in events:
+        try:
+            if not isinstance(event, dict):
+                raise ValueError("event must be an object")
+            docs.append(enhanced_engagement_doc(event) if event.get("kind") == "enhanced" else engagement_doc(event))
+        except (TypeError, ValueError):
+            rejected += 1
+    try:
+        submit_engagements(docs)
+    except IngestQueueFullError:
+        return jsonify({"error": "too many events, please retry"}), 503
+    return jsonify({"status": "ok", "accepted": len(docs), "rejected": rejected})
 
 
 # Progressive profile: save step-by-step partial profile (upsert by anonymous id or email)
@@ -182,109 +381,344 @@ def get_ads():
 
 
 # --- AI / vector index endpoints ---
-def build_vector_index():
+def _localized(field, lang):
+    if isinstance(field, dict):
+        return field.get(lang) or field.get("en")
+    return str(field) if field is not None else None
+
+
+def service_documents(svc, lang="en"):
     """
-    Build or rebuild a FAISS index from services_col. Saves index file + metadata.
-    This should be run via /api/admin/build_index by admin after seeding/updating services.
+    Flatten one service to searchable docs (one per subservice question) in `lang`,
+    falling back to English text where a translation is missing.
     """
-    os.makedirs("data", exist_ok=True)
     docs = []
-    # flatten each service/subservice/question to a searchable doc
-    for svc in services_col.find():
-        svc_id = svc.get("id")
-        svc_name = svc.get("name", {}).get("en") or str(svc.get("name"))
-        for sub in svc.get("subservices", []):
-            sub_id = sub.get("id")
-            sub_name = sub.get("name", {}).get("en") or str(sub.get("name"))
-            # base content: service+subservice name + question text + answer
-            for q in sub.get("questions", []):
-                q_text = q.get("q", {}).get("en") or str(q.get("q"))
-                a_text = q.get("answer", {}).get("en") or str(q.get("answer"))
-                content = " | ".join([svc_name or "", sub_name or "", q_text or "", a_text or ""])
-                docs.append({
-                    "doc_id": f"{svc_id}::{sub_id}::{q_text[:80]}",
-                    "service_id": svc_id,
-                    "subservice_id": sub_id,
-                    "title": q_text,
-                    "content": content,
-                    "metadata": {
-                        "downloads": q.get("downloads", []),
-                        "location": q.get("location"),
-                        "instructions": q.get("instructions")
-                    }
-                })
-    # embed
-    model = get_embedding_model()
-    texts = [d["content"] for d in docs]
-    if not texts:
-        # nothing to index
-        return {"count": 0}
-    embeddings = model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
+    seen = set()
+    svc_id = svc.get("id")
+    svc_name = _localized(svc.get("name"), lang)
+    for sub in svc.get("subservices", []):
+        sub_id = sub.get("id")
+        sub_name = _localized(sub.get("name"), lang)
+        # base content: service+subservice name + question text + answer
+        for q in sub.get("questions", []):
+            q_en = _localized(q.get("q"), "en") or ""
+            q_text = _localized(q.get("q"), lang)
+            a_text = _localized(q.get("answer"), lang)
+            content = " | ".join([svc_name or "", sub_name or "", q_text or "", a_text or ""])
+            # doc_id doubles as the stable vector id, so keep it unique (and the same in every language)
+            doc_id = base_id = f"{svc_id}::{sub_id}::{q_en[:80]}"
+            n = 1
+            while doc_id in seen:
+                n += 1
+                doc_id = f"{base_id}#{n}"
+            seen.add(doc_id)
+            docs.append({
+                "doc_id": doc_id,
+                "lang": lang,
+                "service_id": svc_id,
+                "subservice_id": sub_id,
+                "title": q_text,
+                "content": content,
+                "metadata": {
+                    "downloads": q.get("downloads", []),
+                    "location": q.get("location"),
+                    "instructions": q.get("instructions")
+                }
+            })
+    return docs
+
+
+def embed_texts(texts, lang="en", show_progress_bar=False):
+    model = get_embedding_model(lang)
+    embeddings = model.encode(texts, show_progress_bar=show_progress_bar, convert_to_numpy=True)
     # normalize for cosine if using IP
     norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
     norms[norms == 0] = 1.0
-    embeddings = embeddings / norms
-    if FAISS_AVAILABLE:
-        dim = embeddings.shape[1]
-        index = faiss.IndexFlatIP(dim)
-        # store id mapping separately
-        index.add(embeddings.astype(np.float32))
-        faiss.write_index(index, str(INDEX_PATH))
-    else:
-        # fallback: store embeddings in JSON (slow search)
-        np.save("data/embeddings.npy", embeddings)
-    # save metadata
-    with open(META_PATH, "w", encoding="utf-8") as f:
-        json.dump(docs, f, ensure_ascii=False, indent=2)
-    return {"count": len(docs), "faiss": FAISS_AVAILABLE}
+    return embeddings / norms
+
+
+# concurrent /api/ai/search queries share one forward pass per batch window (one encoder per model)
+query_encoders = {
+    name: BatchingEncoder(
+        lambda texts, lang=lang: embed_texts(texts, lang),
+        max_batch_size=int(os.getenv("QUERY_BATCH_MAX", 32)),
+        batch_window_ms=float(os.getenv("QUERY_BATCH_WINDOW_MS", 5)),
+        max_queue=int(os.getenv("QUERY_QUEUE_MAX", 1024)),
+    )
+    for lang, name in LANGUAGE_MODELS.items() if lang in SEARCH_LANGUAGES
+}
+
+
+def embed_documents(texts, lang="en", show_progress_bar=False, progress=None):
+    """Embed catalog texts, running the model only on texts missing from the cache"""
+    cache = embedding_caches[LANGUAGE_MODELS.get(lang, EMBED_MODEL_NAME)]
+    return cache.encode(texts, lambda missing: embed_texts(missing, lang, show_progress_bar), progress=progress)
+
+
+def build_vector_index(progress=None):
+    """
+    Build or rebuild the per-language FAISS indexes from services_col. Saves index files + metadata.
+    Admins start it as a background job via /api/admin/build_index; seed_data.py calls it directly.
+    `progress` is an optional callback (see index_jobs.BuildJob.progress).
+    """
+    report = progress or (lambda **kw: None)
+    report(stage="loading")
+    started = datetime.utcnow()
+    services = list(services_col.find())
+    shards = {}
+    # flatten each service/subservice/question to a searchable doc, once per language
+    for lang in SEARCH_LANGUAGES:
+        shards[lang] = [d for svc in services for d in service_documents(svc, lang)]
+    report(total=sum(len(docs) for docs in shards.values()))
+    if not any(shards.values()):
+        # nothing to index
+        return {"count": 0}
+    languages = {}
+    used = {}  # embedding model -> texts of the current catalog
+    done_before = todo_before = 0
+    for lang, docs in shards.items():
+        if not docs:
+            continue
+        report(stage=f"encoding {lang}")
+        cache = embedding_caches[LANGUAGE_MODELS[lang]]
+        misses_before = cache.misses
+        embeddings = embed_documents(
+            [d["content"] for d in docs],
+            lang,
+            show_progress_bar=progress is None,
+            progress=lambda done, todo: report(encoded=done_before + done, to_encode=todo_before + todo)
+        )
+        used.setdefault(LANGUAGE_MODELS[lang], []).extend(d["content"] for d in docs)
+        encoded = cache.misses - misses_before
+        done_before += encoded
+        todo_before += encoded
+        # write index + metadata and swap them in atomically for this process
+        report(stage=f"publishing {lang}")
+        snap = vector_stores[lang].publish(embeddings, docs)
+        languages[lang] = {"count": len(docs), "version": snap.version, "encoded": encoded, "cached": len(docs) - encoded}
+    # drop cached vectors of texts that are no longer in the catalog
+    report(stage="compacting embedding cache")
+    for name, texts in used.items():
+        embedding_caches[name].compact(texts)
+    # admin edits made while this build ran went into the index it just replaced: apply them again
+    report(stage="re-applying edits")
+    edited = [d["service_id"] for d in meta_col.find({"kind": "service_edit", "at": {"$gte": started}})]
+    for service_id in edited:
+        update_service_vectors(service_id)
+    meta_col.delete_many({"kind": "service_edit", "at": {"$lt": started}})
+    encoded = sum(l["encoded"] for l in languages.values())
+    count = sum(l["count"] for l in languages.values())
+    return {"count": count, "faiss": FAISS_AVAILABLE, "encoded": encoded, "cached": count - encoded,
+            "reapplied": len(edited), "languages": languages}
+
+
+def update_service_vectors(service_id):
+    """
+    Re-embed only the subservices of `service_id` whose questions changed since the
+    last build (or drop them all if the service was deleted), in every language shard.
+    """
+    svc = services_col.find_one({"id": service_id})
+    results = {}
+    for lang, store in vector_stores.items():
+        snap = store.current()
+        if not len(snap):
+            # no index built yet; /api/admin/build_index picks the change up
+            results[lang] = {"skipped": "no index"}
+            continue
+        new_docs = service_documents(svc, lang) if svc else []
+        # only this service's records are decoded (see IndexSnapshot.ids_where)
+        old = {vid: snap.docs[vid] for vid in snap.ids_where(service_id=service_id)}
+
+        def by_sub(docs):
+            groups = {}
+            for d in docs:
+                groups.setdefault(d.get("subservice_id"), []).append(d)
+            return groups
+
+        old_subs = by_sub(old.values())
+        new_subs = by_sub(new_docs)
+        changed = [sub for sub in old_subs.keys() | new_subs.keys() if old_subs.get(sub) != new_subs.get(sub)]
+        if not changed:
+            results[lang] = {"changed_subservices": 0, "embedded": 0, "version": snap.version}
+            continue
+        remove_ids = [vid for vid, d in old.items() if d.get("subservice_id") in changed]
+        add_docs = [d for sub in changed for d in new_subs.get(sub, [])]
+        embeddings = embed_documents([d["content"] for d in add_docs], lang) if add_docs else None
+        snap = store.apply(remove_ids, embeddings, add_docs)
+        results[lang] = {"changed_subservices": len(changed), "embedded": len(add_docs), "removed": len(remove_ids), "version": snap.version}
+    return results
+
+
+# one build at a time across workers (lease + job state in meta_col); queries keep hitting
+# the old index until it is swapped
+index_jobs = IndexBuildJobs(build_vector_index, meta_col)
 
 
-@app.route("/api/admin/build_index", methods=["POST"])
+@app.route("/api/admin/build_index", methods=["GET", "POST"])
 @admin_required
 def admin_build_index():
-    res = build_vector_index()
-    return jsonify(res)
-
-
-def search_vectors(query, top_k=5):
-    model = get_embedding_model()
-    q_emb = model.encode([query], convert_to_numpy=True)
-    q_emb = q_emb / (np.linalg.norm(q_emb, axis=1, keepdims=True) + 1e-10)
-    if FAISS_AVAILABLE and INDEX_PATH.exists() and META_PATH.exists():
-        index = faiss.read_index(str(INDEX_PATH))
-        D, I = index.search(q_emb.astype(np.float32), top_k)
-        with open(META_PATH, "r", encoding="utf-8") as f:
-            meta = json.load(f)
-        hits = []
-        for idx in I[0]:
-            if idx < len(meta):
-                hits.append(meta[idx])
-        return hits
-    else:
-        # fallback linear scan
-        if not META_PATH.exists():
-            return []
-        meta = json.load(open(META_PATH, "r", encoding="utf-8"))
-        if not os.path.exists("data/embeddings.npy"):
-            return []
-        db_emb = np.load("data/embeddings.npy")
-        sims = (db_emb @ q_emb[0]).tolist()
-        idxs = np.argsort(sims)[::-1][:top_k]
-        return [meta[int(i)] for i in idxs]
+    if request.method == "GET":
+        return jsonify({"active": index_jobs.active(), "jobs": index_jobs.recent()})
+    try:
+        job = index_jobs.start()
+    except BuildAlreadyRunning as e:
+        return jsonify({"error": "build already running", **e.job}), 409
+    return jsonify(job.to_dict()), 202
+
+
+@app.route("/api/admin/build_index/<job_id>")
+@admin_required
+def admin_build_index_status(job_id):
+    job = index_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "unknown job"}), 404
+    return jsonify(job)
+
+
+# repeated citizen questions skip the encoder (vectors) or the whole search (results);
+# result keys include the shard's index version, so a rebuild invalidates them
+query_vector_cache = LRUCache(int(os.getenv("QUERY_CACHE_SIZE", 2048)), os.getenv("QUERY_CACHE_TTL"))
+search_result_cache = LRUCache(int(os.getenv("RESULT_CACHE_SIZE", 1024)), os.getenv("RESULT_CACHE_TTL"))
+
+
+def query_language(query, requested=None):
+    # explicit ?lang wins; otherwise route by script, English for Latin text
+    if requested in vector_stores:
+        return requested
+    lang = detect_language(query)
+    return lang if lang in vector_stores else "en"
+
+
+def search_vectors(query, top_k=5, lang="en"):
+    key = (lang, normalize_query(query))
+    q_emb = query_vector_cache.get(key)
+    if q_emb is None:
+        q_emb = query_encoders[LANGUAGE_MODELS[lang]].encode(key[1])[None, :]
+        query_vector_cache.set(key, q_emb)
+    return vector_stores[lang].search(q_emb, top_k)
+
+
+# BM25 over the same documents as the vector shards. Short keyword queries ("NIC", "119")
+# with a clear lexical winner skip the model; the rest get lexical + vector results fused.
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+LEXICAL_MIN_SCORE = float(os.getenv("LEXICAL_MIN_SCORE", 3.0))
+LEXICAL_MARGIN = float(os.getenv("LEXICAL_MARGIN", 1.5))
+LEXICAL_MAX_TERMS = int(os.getenv("LEXICAL_MAX_TERMS", 3))
+RRF_K = int(os.getenv("RRF_K", 60))
+lexical_indexes = {}  # lang -> (snapshot, BM25Index), rebuilt when the shard's snapshot changes
+lexical_locks = {lang: threading.Lock() for lang in vector_stores}  # one build per language
+lexical_building = set()  # languages with a background rebuild running
+lexical_flag_lock = threading.Lock()  # guards lexical_building; never held while building
+search_latency = PathLatency()
+
+
+def build_lexical_index(lang):
+    with lexical_locks[lang]:
+        snap = vector_stores[lang].current()
+        entry = lexical_indexes.get(lang)
+        if entry is None or entry[0] is not snap:
+            entry = (snap, BM25Index((vid, d.get("content", "")) for vid, d in snap.docs.items()))
+            lexical_indexes[lang] = entry
+        return entry
+
+
+def lexical_index(lang):
+    """
+    (snapshot, BM25Index) for `lang`. After the shard changes, the previous pair (whose ids
+    refer to its own snapshot) keeps serving while one background thread builds the new one;
+    only the first search of a language waits for a build.
+    """
+    entry = lexical_indexes.get(lang)
+    if entry is None:
+        return build_lexical_index(lang)
+    if entry[0] is not vector_stores[lang].current():
+        with lexical_flag_lock:
+            start = lang not in lexical_building
+            lexical_building.add(lang)
+        if start:
+            def run():
+                try:
+                    build_lexical_index(lang)
+                except Exception:
+                    traceback.print_exc()
+                finally:
+                    with lexical_flag_lock:
+                        lexical_building.discard(lang)
+
+            threading.Thread(target=run, name=f"lexical-{lang}", daemon=True).start()
+    return entry
+
+
+def hybrid_search(query, top_k=5, lang="en"):
+    """Returns (hits, path) where path is "lexical", "hybrid" or "vector" """
+    if not HYBRID_SEARCH:
+        return search_vectors(query, top_k, lang), "vector"
+    snap, lex = lexical_index(lang)
+    depth = max(top_k * 4, 20)
+    terms, lex_hits = lex.search(query, depth)
+    if confident(terms, lex_hits, LEXICAL_MIN_SCORE, LEXICAL_MARGIN, LEXICAL_MAX_TERMS):
+        return [snap.docs[vid] for vid, _, _ in lex_hits[:top_k]], "lexical"
+    vec_hits = search_vectors(query, depth, lang)
+    if not lex_hits:
+        return vec_hits[:top_k], "vector"
+    docs = {d["doc_id"]: d for d in vec_hits}
+    lex_ids = []
+    for vid, _, _ in lex_hits:
+        d = snap.docs[vid]
+        docs.setdefault(d["doc_id"], d)
+        lex_ids.append(d["doc_id"])
+    fused = reciprocal_rank_fusion([lex_ids, [d["doc_id"] for d in vec_hits]], RRF_K)
+    return [docs[doc_id] for doc_id in fused[:top_k]], "hybrid"
+
+
+@app.route("/api/admin/index_status")
+@admin_required
+def admin_index_status():
+    status = {}
+    for lang, store in vector_stores.items():
+        store.current()
+        status[lang] = store.stats()
+    return jsonify(status)
+
+
+@app.route("/api/admin/ai_metrics")
+@admin_required
+def admin_ai_metrics():
+    return jsonify({
+        "index": {lang: store.stats() for lang, store in vector_stores.items()},
+        "query_encoder": {name: enc.stats() for name, enc in query_encoders.items()},
+        "embedding_cache": {name: cache.stats() for name, cache in embedding_caches.items()},
+        "query_vector_cache": query_vector_cache.stats(),
+        "search_result_cache": search_result_cache.stats(),
+        "search_paths": search_latency.stats(),
+        "autosuggest": suggest_index.stats(),
+        "catalog_cache": catalog_cache.stats()
+    })
 
 
 @app.route("/api/ai/search", methods=["POST"])
 def ai_search():
     """
-    Accepts: {query: "...", top_k: 5}
-    Returns: {answer: "...", sources: [ {...} ] }
+    Accepts: {query: "...", top_k: 5, lang: optional, detected from the query script}
+    Returns: {answer: "...", sources: [ {...} ], lang: "..."}
     """
     payload = request.json or {}
     query = payload.get("query", "").strip()
     top_k = int(payload.get("top_k", 5))
     if not query:
         return jsonify({"error": "empty query"}), 400
-    hits = search_vectors(query, top_k)
+    lang = query_language(query, payload.get("lang"))
+    cache_key = (lang, normalize_query(query), top_k, vector_stores[lang].current().version)
+    done = search_latency.timer()
+    cached = search_result_cache.get(cache_key)
+    if cached is not None:
+        done("cached")
+        return jsonify({"query": query, **cached})
+    try:
+        hits, path = hybrid_search(query, top_k, lang)
+    except (QueueFullError, EncodeTimeout):
+        # queue full, or the batch did not finish within the encoder timeout
+        return jsonify({"error": "search is busy, please retry"}), 503
     # Build a simple answer: concatenate top answers and include source pointers
     # Optionally: here you would call an LLM (OpenAI) to produce a natural language answer
     answer_parts = []
@@ -300,7 +734,10 @@ def ai_search():
             **h.get("metadata", {})
         })
     answer = "\n\n---\n\n".join(answer_parts) if answer_parts else "No matching content found."
-    return jsonify({"query": query, "answer": answer, "sources": sources, "hits": len(sources)})
+    result = {"answer": answer, "sources": sources, "hits": len(sources), "lang": lang, "retrieval": path}
+    search_result_cache.set(cache_key, result)
+    done(path)
+    return jsonify({"query": query, **result})
 
 
 # --- Admin auth with bcrypt ---
@@ -346,14 +783,29 @@ def admin_services():
     if not sid:
         return jsonify({"error": "id required"}), 400
     services_col.update_one({"id": sid}, {"$set": payload}, upsert=True)
-    return jsonify({"status": "ok"})
+    catalog_changed(sid)
+    return jsonify({"status": "ok", "index": refresh_service_index(sid)})
 
 
 @app.route("/api/admin/services/<service_id>", methods=["DELETE"])
 @admin_required
 def delete_service(service_id):
     services_col.delete_one({"id": service_id})
-    return jsonify({"status": "deleted"})
+    catalog_changed(service_id)
+    return jsonify({"status": "deleted", "index": refresh_service_index(service_id)})
+
+
+def refresh_service_index(service_id):
+    suggest_index.invalidate()
+    # the service write already succeeded; an index failure only means a full rebuild is needed
+    try:
+        # a full build running meanwhile re-applies this edit after publishing (build_vector_index)
+        meta_col.update_one({"_id": f"service_edit:{service_id}"},
+                            {"$set": {"kind": "service_edit", "service_id": service_id, "at": datetime.utcnow()}},
+                            upsert=True)
+        return update_service_vectors(service_id)
+    except Exception as e:
+        return {"error": str(e)}
 
 
 # categories
@@ -368,10 +820,12 @@ def manage_categories():
         if not cid:
             return jsonify({"error": "id required"}), 400
         categories_col.update_one({"id": cid}, {"$set": payload}, upsert=True)
+        catalog_changed()
         return jsonify({"status": "ok"})
     if request.method == "DELETE":
         cid = request.args.get("id")
         categories_col.delete_one({"id": cid})
+        catalog_changed()
         return jsonify({"status": "deleted"})
 
 
@@ -414,57 +868,128 @@ def manage_ads():
 
 
 # --- Admin insights (kept but extended) ---
+def parse_date(value, default):
+    if not value:
+        return default
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+INSIGHTS_TOP_N = int(os.getenv("INSIGHTS_TOP_N", 20))
+# window of the sketched figures (unique users / sessions, premium suggestions) without ?start=
+INSIGHTS_SKETCH_DAYS = float(os.getenv("INSIGHTS_SKETCH_DAYS", 30))
+
+
+def or_unknown(field):
+    # missing / null / "" -> "Unknown", like the Python `x or "Unknown"` it replaces
+    return {"$cond": [{"$in": [{"$ifNull": [field, ""]}, [""]]}, "Unknown", field]}
+
+
+def top_counts(key, limit):
+    return [{"$group": {"_id": key, "count": {"$sum": 1}}}, {"$sort": {"count": -1, "_id": 1}}, {"$limit": limit}]
+
+
+def raw_insights(start, end, limit):
+    # everything is computed server-side in one $facet pass; only top-N summaries come back
+    match = {}
+    if start or end:
+        match["timestamp"] = {**({"$gte": start} if start else {}), **({"$lt": end} if end else {})}
+    job = {"$cond": [{"$eq": [{"$type": "$job"}, "string"]}, {"$trim": {"input": "$job"}}, ""]}
+    facets = {
+        "age_groups": [
+            {"$match": {"age": {"$type": "number", "$gt": 0}}},
+            {"$bucket": {"groupBy": "$age", "boundaries": [lo for lo, _, _ in AGE_GROUPS] + [AGE_GROUPS[-1][1]],
+                         "default": "other", "output": {"count": {"$sum": 1}}}},
+        ],
+        "jobs": [{"$project": {"job": job}}] + top_counts(or_unknown("$job"), limit),
+        "services": top_counts(or_unknown("$service"), limit),
+        "questions": top_counts(or_unknown("$question_clicked"), limit),
+        "ads": [{"$match": {"ad": {"$nin": [None, ""]}}}] + top_counts("$ad", limit),
+        "desires": [{"$unwind": "$desires"}] + top_counts("$desires", limit),
+        "premium_suggestions": [
+            {"$match": {"user_id": {"$nin": [None, ""]}}},
+            {"$group": {"_id": {"user": "$user_id", "question": "$question_clicked"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gte": 2}}},
+            {"$sort": {"count": -1}},
+            {"$limit": limit},
+        ],
+    }
+    pipeline = ([{"$match": match}] if match else []) + [{"$facet": facets}]
+    result = next(iter(eng_col.aggregate(pipeline, allowDiskUse=True)), {})
+
+    age_groups = {label: 0 for _, _, label in AGE_GROUPS}
+    for row in result.get("age_groups", []):
+        label = next((l for lo, _, l in AGE_GROUPS if lo == row["_id"]), None)
+        if label:
+            age_groups[label] += row["count"]
+
+    def counts(name):
+        return {str(r["_id"]): r["count"] for r in result.get(name, [])}
+
+    return {
+        "age_groups": age_groups,
+        "jobs": counts("jobs"),
+        "services": counts("services"),
+        "questions": counts("questions"),
+        "ads": counts("ads"),
+        "desires": counts("desires"),
+        "premium_suggestions": [{"user": r["_id"]["user"], "question": r["_id"].get("question"), "count": r["count"]}
+                                for r in result.get("premium_suggestions", [])]
+    }
+
+
+def counter_insights(start, end, limit, sketch):
+    # O(days) counter documents (engagement_counters.py); whole days only. Repeated
+    # user/question pairs are approximate, from the per-day sketches (`sketch`)
+    summary = engagement_counters.summary(start or datetime(1970, 1, 1), end or datetime.utcnow() + timedelta(days=1), limit)
+
+    def counts(dim):
+        return {str(k): n for k, n in summary.get(dim, [])}
+
+    return {
+        "age_groups": {label: counts("age_group").get(label, 0) for _, _, label in AGE_GROUPS},
+        "jobs": counts("job"),
+        "services": counts("service"),
+        "questions": counts("question"),
+        "ads": counts("ad"),
+        "desires": counts("desire"),
+        "premium_suggestions": [{"user": p["user"], "question": p["question"], "count": p["estimate"]}
+                                for p in sketch["repeated_pairs"]]
+    }
+
+
 @app.route("/api/admin/insights")
 @admin_required
 def admin_insights():
-    # Age groups, jobs, services, questions (as before) ... plus top ads (clicks)
-    age_groups = {"<18": 0, "18-25": 0, "26-40": 0, "41-60": 0, "60+": 0}
-    for e in eng_col.find({}, {"age": 1}):
-        age = e.get("age")
-        if not age:
-            continue
-        try:
-            age = int(age)
-            if age < 18:
-                age_groups["<18"] += 1
-            elif age <= 25:
-                age_groups["18-25"] += 1
-            elif age <= 40:
-                age_groups["26-40"] += 1
-            elif age <= 60:
-                age_groups["41-60"] += 1
-            else:
-                age_groups["60+"] += 1
-        except:
-            continue
-    jobs = {}
-    services = {}
-    questions = {}
-    desires = {}
-    for e in eng_col.find({}, {"job": 1, "service": 1, "question_clicked": 1, "desires": 1, "ad": 1}):
-        j = (e.get("job") or "Unknown").strip()
-        jobs[j] = jobs.get(j, 0) + 1
-        s = e.get("service") or "Unknown"
-        services[s] = services.get(s, 0) + 1
-        q = e.get("question_clicked") or "Unknown"
-        questions[q] = questions.get(q, 0) + 1
-        for d in e.get("desires") or []:
-            desires[d] = desires.get(d, 0) + 1
-    # premium suggestions
-    pipeline = [
-        {"$group": {"_id": {"user": "$user_id", "question": "$question_clicked"}, "count": {"$sum": 1}}},
-        {"$match": {"count": {"$gte": 2}}}
-    ]
-    repeated = list(eng_col.aggregate(pipeline))
-    premium_suggestions = [{"user": r["_id"]["user"], "question": r["_id"]["question"], "count": r["count"]} for r in repeated if r["_id"]["user"]]
-    return jsonify({
-        "age_groups": age_groups,
-        "jobs": jobs,
-        "services": services,
-        "questions": questions,
-        "desires": desires,
-        "premium_suggestions": premium_suggestions
-    })
+    # optional ?start=&end= (ISO dates), ?limit= (entries per chart) and ?source=raw to
+    # aggregate raw events (exact times, but only within the TTL) instead of the daily counters
+    start = parse_date(request.args.get("start"), None)
+    end = parse_date(request.args.get("end"), None)
+    if start is None and request.args.get("start") or end is None and request.args.get("end"):
+        return jsonify({"error": "start / end must be ISO dates"}), 400
+    limit = max(1, min(request.args.get("limit", INSIGHTS_TOP_N, type=int), 500))
+    sketch_end = end or datetime.utcnow() + timedelta(days=1)
+    sketch_start = start or sketch_end - timedelta(days=INSIGHTS_SKETCH_DAYS)
+    sketch = engagement_sketches.summary(sketch_start, sketch_end, limit)
+    approx = {**{k: sketch[k] for k in ("unique_users", "unique_sessions")}, "since": sketch_start.isoformat()}
+    if request.args.get("source") == "raw":
+        return jsonify({**raw_insights(start, end, limit), "approx": approx, "source": "raw"})
+    return jsonify({**counter_insights(start, end, limit, sketch), "approx": approx, "source": "counters"})
+
+
+@app.route("/api/admin/sketches")
+@admin_required
+def admin_sketches():
+    # approximate distinct users / sessions and top questions, services, ads (sketches.py
+    # documents the error bounds); ?start=&end= ISO dates, default the last 7 days
+    end = parse_date(request.args.get("end"), datetime.utcnow())
+    start = parse_date(request.args.get("start"), (end or datetime.utcnow()) - timedelta(days=7))
+    if start is None or end is None or start >= end:
+        return jsonify({"error": "start / end must be ISO dates with start < end"}), 400
+    limit = max(1, min(request.args.get("limit", 10, type=int), 64))
+    return jsonify({"start": start.isoformat(), "end": end.isoformat(), **engagement_sketches.summary(start, end, limit)})
 
 
 @app.route("/api/admin/engagements")
@@ -478,6 +1003,36 @@ def admin_engagements():
     return jsonify(items)
 
 
+@app.route("/api/admin/ingest_status")
+@admin_required
+def admin_ingest_status():
+    return jsonify({**engagement_writer.stats(), "rollups": engagement_rollups.stats(), "counters": engagement_counters.stats(),
+                    "sketches": engagement_sketches.stats()})
+
+
+@app.route("/api/admin/engagement_trends")
+@admin_required
+def admin_engagement_trends():
+    # ?dim=service|question|ad|source|type&start=&end= (ISO dates, default last 30 days)&granularity=hour|day
+    end = parse_date(request.args.get("end"), datetime.utcnow())
+    start = parse_date(request.args.get("start"), (end or datetime.utcnow()) - timedelta(days=30))
+    if start is None or end is None or start >= end:
+        return jsonify({"error": "start / end must be ISO dates with start < end"}), 400
+    granularity = request.args.get("granularity", "day")
+    if granularity not in ("hour", "day"):
+        return jsonify({"error": "granularity must be hour or day"}), 400
+    dim = request.args.get("dim", "service")
+    limit = max(1, min(request.args.get("limit", 10, type=int), 100))
+    return jsonify({
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "total": engagement_rollups.total(start, end),
+        "series": [{"t": t.isoformat(), "count": n} for t, n in engagement_rollups.series(start, end, granularity)],
+        "top": [{"key": k, "count": n} for k, n in engagement_rollups.top(dim, start, end, limit)],
+        "rollups": engagement_rollups.stats(),
+    })
+
+
 # CSV export (extended for ads)
 @app.route("/api/admin/export_csv")
 @admin_required
@@ -515,9 +1070,8 @@ def dashboard():
     if not session.get("admin_logged_in"):
         return redirect("/admin/login")
     
-    # Get enhanced analytics
-    analytics_response = get_dashboard_analytics()
-    analytics = analytics_response.get_json()
+    # Get enhanced analytics (cached, see dashboard_cache)
+    analytics = dashboard_analytics()
     
     # We need to create a dashboard template or pass to existing one
     # If dashboard.html doesn't exist, we might need to create it.
@@ -574,15 +1128,13 @@ def extended_profile():
     return jsonify({"status": "ok"})
 
 # 1.2 Enhanced Engagement Tracking
-@app.route("/api/engagement/enhanced", methods=["POST"])
-def log_enhanced_engagement():
-    payload = request.json or {}
+def enhanced_engagement_doc(payload):
     # Extract behavioral data
     user_agent = request.headers.get('User-Agent', '')
     ip_address = request.remote_addr
     referrer = request.headers.get('Referer', '')
     
-    doc = {
+    return {
         "user_id": payload.get("user_id"),
         "session_id": payload.get("session_id"),
         "age": int(payload.get("age")) if payload.get("age") else None,
@@ -609,8 +1161,12 @@ def log_enhanced_engagement():
         },
         "timestamp": datetime.utcnow()
     }
-    eng_col.insert_one(doc)
-    return jsonify({"status": "ok"})
+
+
+@app.route("/api/engagement/enhanced", methods=["POST"])
+def log_enhanced_engagement():
+    payload = request.json or {}
+    return queue_engagements([enhanced_engagement_doc(payload)])
 
 # --- Smart Recommendation Algorithm ---
 
@@ -678,7 +1234,8 @@ def get_store_categories():
 def create_order():
     payload = request.json or {}
     order = {
-        "order_id": f"ORD{datetime.utcnow().strftime('%Y%m%d%H%M%S')}",
+        # timestamp + random suffix: order_id is unique (db_indexes.py) and orders can share a second
+        "order_id": f"ORD{datetime.utcnow().strftime('%Y%m%d%H%M%S')}{secrets.token_hex(3).upper()}",
         "user_id": payload.get("user_id"),
         "items": payload.get("items", []),
         "total_amount": payload.get("total_amount", 0),
@@ -715,29 +1272,31 @@ def process_payment():
     payments_col.insert_one(payment)
     
     # Log engagement for recommendation system
-    eng_col.insert_one({
+    purchase = {
         "user_id": payload.get("user_id"),
         "type": "purchase",
         "product_ids": [item.get("product_id") for item in payload.get("items", [])],
         "amount": payload.get("amount", 0),
         "timestamp": datetime.utcnow()
-    })
+    }
+    eng_col.insert_one(purchase)
+    engagement_counters.add([purchase])
+    engagement_sketches.add([purchase])
     
     return jsonify({"status": "ok", "payment_id": payment["payment_id"]})
 
 # --- Enhanced Dashboard with Analytics ---
 
-@app.route("/api/dashboard/analytics")
-@admin_required
-def get_dashboard_analytics():
+def compute_dashboard_analytics():
     # User analytics
     total_users = users_col.count_documents({})
     # active_users logic: "last_active" exists
     active_users = users_col.count_documents({"last_active": {"$gte": datetime.utcnow() - timedelta(days=30)}})
     
-    # Engagement analytics
-    total_engagements = eng_col.count_documents({})
-    recent_engagements = eng_col.count_documents({"timestamp": {"$gte": datetime.utcnow() - timedelta(days=7)}})
+    # Engagement analytics (from the rollups; raw events expire)
+    total_engagements = engagement_rollups.total()
+    recent_engagements = engagement_rollups.total(datetime.utcnow() - timedelta(days=7))
+    unique_users_7d = engagement_sketches.summary(datetime.utcnow() - timedelta(days=7), datetime.utcnow())["unique_users"]
     
     # Store analytics
     total_orders = orders_col.count_documents({})
@@ -750,14 +1309,10 @@ def get_dashboard_analytics():
     revenue_result = list(cursor_rev)
     total_revenue_amount = revenue_result[0]["total"] if revenue_result else 0
     
-    # User segmentation (Sample - in real app this might be pre-calculated)
-    # We'll just sample last 100 users for performance if DB is huge
-    user_segments = {}
-    users = users_col.find().sort("created", -1).limit(100)
-    for user in users:
-        segments = recommendation_engine.get_user_segment(str(user["_id"]))
-        for segment in segments:
-            user_segments[segment] = user_segments.get(segment, 0) + 1
+    # User segmentation: every user, in one projected pass (no per-user queries)
+    user_segments = recommendation_engine.segment_users(
+        users_col.find({}, RecommendationEngine.SEGMENT_FIELDS, batch_size=1000)
+    )
             
     # Popular products
     popular_products = list(products_col.find().sort("rating", -1).limit(5))
@@ -775,7 +1330,7 @@ def get_dashboard_analytics():
             act["timestamp"] = act["timestamp"].isoformat()
         recent_activities.append(act)
 
-    return jsonify({
+    return {
         "user_metrics": {
             "total_users": total_users,
             "active_users": active_users,
@@ -784,6 +1339,7 @@ def get_dashboard_analytics():
         "engagement_metrics": {
             "total_engagements": total_engagements,
             "recent_engagements": recent_engagements,
+            "unique_users_7d": unique_users_7d,  # approximate (HyperLogLog, ~0.8% error)
             "avg_session_duration": "5m 23s" 
         },
         "store_metrics": {
@@ -794,7 +1350,25 @@ def get_dashboard_analytics():
         "user_segments": user_segments,
         "popular_products": popular_products,
         "recent_activities": recent_activities
-    })
+    }
+
+
+# served stale-while-revalidate: admins get the last payload at once, older than
+# DASHBOARD_MAX_AGE seconds triggers a background recompute; ?refresh=1 recomputes now
+dashboard_cache = StaleWhileRevalidate(
+    compute_dashboard_analytics, max_age=float(os.getenv("DASHBOARD_MAX_AGE", 60)), name="dashboard-refresh"
+)
+
+
+def dashboard_analytics():
+    analytics, computed_at, stale = dashboard_cache.get(force=request.args.get("refresh") == "1")
+    return {**analytics, "computed_at": computed_at.isoformat() + "Z", "stale": stale}
+
+
+@app.route("/api/dashboard/analytics")
+@admin_required
+def get_dashboard_analytics():
+    return jsonify(dashboard_analytics())
 
 # --- Ethical Data Collection ---
 
@@ -852,6 +1426,7 @@ def delete_user_data(user_id):
             {"user_id": user_id},
             {"$set": {"user_id": None, "anonymized": True}}
         )
+        engagement_sketches.forget_user(user_id)
         
         if result.deleted_count > 0:
             return jsonify({"status": "ok", "message": "User data deleted"})
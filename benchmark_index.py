@@ -0,0 +1,89 @@
+# benchmark_index.py (compare AI search index types on the real catalog corpus)
+#
+#   python benchmark_index.py                 # all index types, recall@5
+#   python benchmark_index.py --k 10 --synthetic 50000 --types flat,hnsw,ivf_sq8
+#
+# Recall is measured against the exact flat index. --synthetic pads the corpus with
+# random unit vectors to see how each type behaves at catalog sizes we do not have yet.
+import sys
+import time
+import argparse
+
+import numpy as np
+
+import index_factory
+from vector_store import VectorStore, decode_vectors
+
+
+def load_corpus(data_dir):
+    store = VectorStore(data_dir)
+    snap = store.current()
+    if not len(snap):
+        sys.exit(f"No index in {data_dir}/ - run seed_data.py or POST /api/admin/build_index first")
+    ids = snap.docs.keys()
+    if snap.vectors is not None:
+        vectors = decode_vectors(snap.vectors)
+    else:
+        vectors = np.vstack([snap.index.reconstruct(int(vid)) for vid in ids])
+    return np.ascontiguousarray(vectors, dtype=np.float32), np.array(ids, dtype=np.int64)
+
+
+def unit(x):
+    return x / (np.linalg.norm(x, axis=1, keepdims=True) + 1e-10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AI search index types")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--synthetic", type=int, default=0, help="extra random vectors to add to the corpus")
+    parser.add_argument("--types", default=",".join(index_factory.INDEX_TYPES))
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if not index_factory.FAISS_AVAILABLE:
+        sys.exit("faiss is not installed")
+    rng = np.random.default_rng(args.seed)
+    vectors, ids = load_corpus(args.data_dir)
+    real = len(vectors)
+    if args.synthetic:
+        extra = unit(rng.standard_normal((args.synthetic, vectors.shape[1])).astype(np.float32))
+        vectors = np.vstack([vectors, extra])
+        ids = np.concatenate([ids, np.arange(args.synthetic, dtype=np.int64) + ids.max() + 1])
+    # queries: perturbed copies of real catalog questions (what citizens ask is close to them)
+    picks = rng.integers(0, real, args.queries)
+    queries = unit(vectors[picks] + 0.15 * rng.standard_normal((args.queries, vectors.shape[1])).astype(np.float32))
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(args.k, len(vectors))
+
+    exact = index_factory.build_index(vectors, ids, kind="flat")
+    _, truth = exact.search(queries, k)
+
+    print(f"corpus: {real} real + {args.synthetic} synthetic vectors, dim={vectors.shape[1]}, "
+          f"{args.queries} queries, k={k}, auto choice: {index_factory.choose_index_type(len(vectors))}")
+    print(f"{'type':<10}{'recall@k':>10}{'p50 ms':>10}{'p99 ms':>10}{'build s':>10}{'memory MB':>12}")
+    for kind in [t.strip() for t in args.types.split(",") if t.strip()]:
+        try:
+            t0 = time.perf_counter()
+            index = index_factory.build_index(vectors, ids, kind=kind)
+            build_s = time.perf_counter() - t0
+        except ValueError as e:
+            print(f"{kind:<10}  skipped: {e}")
+            continue
+        latencies = []
+        found = []
+        for q in queries:
+            t0 = time.perf_counter()
+            _, I = index.search(q[None, :], k)
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+            found.append(I[0])
+        found = np.vstack(found)
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        mb = index_factory.index_bytes(index) / (1024 * 1024)
+        print(f"{kind:<10}{recall:>10.3f}{np.percentile(latencies, 50):>10.3f}{np.percentile(latencies, 99):>10.3f}"
+              f"{build_s:>10.2f}{mb:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
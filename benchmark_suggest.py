@@ -0,0 +1,90 @@
+# benchmark_suggest.py (typo-tolerant autosuggest lookup cost vs vocabulary size)
+#
+#   python benchmark_suggest.py                       # 1k, 10k and 50k synthetic terms
+#   python benchmark_suggest.py --sizes 10000,100000 --queries 2000
+#
+# Builds a synthetic catalog whose names/questions use N distinct words, then times
+# autosuggest lookups for exact words and words with 1 and 2 typos. With the
+# deletion index the per-lookup time should stay flat as N grows. (Words of 5 letters
+# or fewer only get 1 typo corrected, so "found" is below 100% for 2 typos.)
+import time
+import string
+import argparse
+
+import numpy as np
+
+from suggest_index import PrefixTable
+
+
+def random_words(rng, n):
+    words = set()
+    letters = np.array(list(string.ascii_lowercase))
+    while len(words) < n:
+        words.add("".join(rng.choice(letters, rng.integers(5, 12))))
+    return sorted(words)
+
+
+def catalog(rng, words, per_question=6):
+    services = []
+    order = rng.permutation(len(words))
+    for s, start in enumerate(range(0, len(words), per_question * 10)):
+        chunk = [words[i] for i in order[start:start + per_question * 10]]
+        subs = []
+        for k in range(0, len(chunk), per_question):
+            part = chunk[k:k + per_question]
+            subs.append({"id": f"sub{k}", "name": {"en": " ".join(part[:2])},
+                         "questions": [{"q": {"en": " ".join(part)}}]})
+        services.append({"id": f"svc{s}", "name": {"en": " ".join(chunk[:2])}, "subservices": subs})
+    return services
+
+
+def typo(rng, word, edits):
+    letters = string.ascii_lowercase
+    for _ in range(edits):
+        i = int(rng.integers(0, len(word)))
+        op = rng.integers(0, 3)
+        if op == 0:
+            word = word[:i] + word[i + 1:]
+        elif op == 1:
+            word = word[:i] + letters[int(rng.integers(0, 26))] + word[i:]
+        else:
+            word = word[:i] + letters[int(rng.integers(0, 26))] + word[i + 1:]
+    return word
+
+
+def timed(table, queries):
+    latencies = []
+    found = 0
+    for q in queries:
+        t0 = time.perf_counter()
+        hits = table.suggest(q, 20)
+        latencies.append((time.perf_counter() - t0) * 1e6)
+        found += bool(hits)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99), found / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark typo-tolerant autosuggest")
+    parser.add_argument("--sizes", default="1000,10000,50000")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--max-edit", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'terms':>8}{'deletes':>10}{'build s':>9}  {'query':<8}{'p50 us':>9}{'p99 us':>9}{'found':>8}")
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        words = random_words(rng, size)
+        t0 = time.perf_counter()
+        table = PrefixTable(catalog(rng, words), args.max_edit)
+        build_s = time.perf_counter() - t0
+        sample = [words[i] for i in rng.integers(0, len(words), args.queries)]
+        for label, edits in (("exact", 0), ("1 typo", 1), ("2 typos", 2)):
+            queries = [typo(rng, w, edits) for w in sample]
+            p50, p99, found = timed(table, queries)
+            head = f"{len(table.fuzzy.counts):>8}{len(table.fuzzy.deletes):>10}{build_s:>9.2f}" if not edits else " " * 27
+            print(f"{head}  {label:<8}{p50:>9.1f}{p99:>9.1f}{found:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
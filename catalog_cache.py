@@ -0,0 +1,85 @@
+# catalog_cache.py (versioned read-through cache for the public catalog endpoints)
+import gzip
+import time
+import hashlib
+import threading
+from collections import namedtuple
+
+from pymongo import ReturnDocument
+
+
+# one serialized response; `gzipped` is None when the body is too small to be worth it
+CatalogBody = namedtuple("CatalogBody", "data gzipped")
+
+
+class CatalogCache:
+    """
+    Serialized catalog responses keyed by (endpoint, args) and stamped with the catalog
+    version. The version lives in Mongo (meta collection, _id "catalog") so every process
+    agrees on it; each process re-reads it at most every `check_interval` seconds.
+    Admin writes call bump(), which invalidates every cached body at once.
+    Bodies are gzipped once when built, so a hot read is a dict lookup returning bytes.
+    """
+
+    def __init__(self, meta_col, check_interval=2.0, max_entries=1024, min_gzip_bytes=512):
+        self.meta_col = meta_col
+        self.check_interval = check_interval
+        self.max_entries = max_entries
+        self.min_gzip_bytes = min_gzip_bytes
+        self._version = None
+        self._checked = 0.0
+        self._bodies = {}  # key -> (version, CatalogBody)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self):
+        now = time.monotonic()
+        if self._version is None or now - self._checked >= self.check_interval:
+            doc = self.meta_col.find_one({"_id": "catalog"})
+            self._version = (doc or {}).get("version", 0)
+            self._checked = now
+        return self._version
+
+    def bump(self):
+        doc = self.meta_col.find_one_and_update(
+            {"_id": "catalog"}, {"$inc": {"version": 1}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        with self._lock:
+            self._version = doc["version"]
+            self._checked = time.monotonic()
+            self._bodies.clear()
+        return self._version
+
+    def etag(self, key, version):
+        # derived from version + key only, so a 304 never needs the body
+        h = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=8).hexdigest()
+        return f"c{version}-{h}"
+
+    def body(self, key, version, build_fn):
+        """CatalogBody for `key` at `version`, calling build_fn() -> bytes on a miss"""
+        entry = self._bodies.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        raw = build_fn()
+        gz = gzip.compress(raw, 6) if len(raw) >= self.min_gzip_bytes else None
+        data = CatalogBody(raw, gz if gz is not None and len(gz) < len(raw) else None)
+        with self._lock:
+            if len(self._bodies) >= self.max_entries:
+                self._bodies.clear()
+            self._bodies[key] = (version, data)
+        return data
+
+    def stats(self):
+        bodies = [b for _, b in self._bodies.values()]
+        return {
+            "version": self._version,
+            "entries": len(bodies),
+            "bytes": sum(len(b.data) for b in bodies),
+            "gzip_bytes": sum(len(b.gzipped) for b in bodies if b.gzipped),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
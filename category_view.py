@@ -0,0 +1,112 @@
+# category_view.py (materialized category -> ministries view for the homepage grid)
+from datetime import datetime
+
+UNCATEGORIZED = "uncategorized"
+# only what the category grid + ministry list need; questions are fetched on click
+SERVICE_FIELDS = {"_id": 0, "id": 1, "name": 1, "category": 1, "subservices.id": 1, "subservices.name": 1}
+
+
+def ministry_summary(svc):
+    subs = [{"id": sub.get("id"), "name": sub.get("name")} for sub in svc.get("subservices", [])]
+    return {"id": svc.get("id"), "name": svc.get("name"), "subservice_count": len(subs), "subservices": subs}
+
+
+class CategoryView:
+    """
+    One document per category in `view_col`, with its ministries (and their subservice
+    names) embedded, so /api/categories is a single find() instead of an aggregation plus
+    a full services download. Seeded categories list their ministries in `ministry_ids`;
+    without any category documents, services are grouped by their `category` field.
+    """
+
+    def __init__(self, services_col, categories_col, view_col):
+        self.services_col = services_col
+        self.categories_col = categories_col
+        self.view_col = view_col
+
+    def _members(self, cat, services):
+        ids = cat.get("ministry_ids") or []
+        if ids:
+            by_id = {s.get("id"): s for s in services}
+            return [by_id[i] for i in ids if i in by_id]
+        return [s for s in services if (s.get("category") or UNCATEGORIZED) == cat["id"]]
+
+    def _doc(self, cat, members, order):
+        ministries = [ministry_summary(s) for s in members]
+        return {
+            **cat,
+            "ministries": ministries,
+            "ministry_count": len(ministries),
+            "subservice_count": sum(m["subservice_count"] for m in ministries),
+            "order": order,
+            "updated": datetime.utcnow(),
+        }
+
+    def _categories(self, services):
+        cats = list(self.categories_col.find({}, {"_id": 0}))
+        if cats:
+            return cats
+        # not seeded: one dynamic category per distinct service.category
+        ids = sorted({s.get("category") or UNCATEGORIZED for s in services})
+        return [{"id": c, "name": {"en": "Uncategorized" if c == UNCATEGORIZED else c}} for c in ids]
+
+    def rebuild(self):
+        """Recompute every category (category writes, reseeding, first read)"""
+        services = list(self.services_col.find({}, SERVICE_FIELDS))
+        cats = self._categories(services)
+        for order, cat in enumerate(cats):
+            self.view_col.replace_one({"id": cat["id"]}, self._doc(cat, self._members(cat, services), order), upsert=True)
+        self.view_col.delete_many({"id": {"$nin": [c["id"] for c in cats]}})
+        return len(cats)
+
+    def service_changed(self, service_id):
+        """Recompute only the categories the service was or is now part of"""
+        svc = self.services_col.find_one({"id": service_id}, SERVICE_FIELDS)
+        affected = {d["id"] for d in self.view_col.find({"ministries.id": service_id}, {"id": 1})}
+        seeded = self.categories_col.count_documents({}) > 0
+        if seeded:
+            query = [{"ministry_ids": service_id}]
+            if svc and svc.get("category"):
+                query.append({"id": svc["category"], "ministry_ids": {"$in": [None, []]}})
+            affected |= {c["id"] for c in self.categories_col.find({"$or": query}, {"id": 1})}
+        elif svc:
+            category = svc.get("category") or UNCATEGORIZED
+            if not self.view_col.count_documents({"id": category}):
+                # a new dynamic category changes the ordering; just redo everything
+                return self.rebuild()
+            affected.add(category)
+        for cat_id in affected:
+            self._refresh(cat_id, seeded)
+        return len(affected)
+
+    def _refresh(self, cat_id, seeded):
+        existing = self.view_col.find_one({"id": cat_id}, {"order": 1}) or {}
+        if seeded:
+            cat = self.categories_col.find_one({"id": cat_id}, {"_id": 0})
+        else:
+            cat = {"id": cat_id, "name": {"en": "Uncategorized" if cat_id == UNCATEGORIZED else cat_id}}
+        if cat is None:
+            self.view_col.delete_one({"id": cat_id})
+            return
+        ids = cat.get("ministry_ids") or []
+        if ids:
+            services = list(self.services_col.find({"id": {"$in": ids}}, SERVICE_FIELDS))
+        elif cat_id == UNCATEGORIZED:
+            services = list(self.services_col.find({"category": {"$in": [None, ""]}}, SERVICE_FIELDS))
+        else:
+            services = list(self.services_col.find({"category": cat_id}, SERVICE_FIELDS))
+        members = self._members(cat, services)
+        if not seeded and not members:
+            self.view_col.delete_one({"id": cat_id})
+            return
+        order = existing.get("order", self.view_col.count_documents({}))
+        self.view_col.replace_one({"id": cat_id}, self._doc(cat, members, order), upsert=True)
+
+    def read(self):
+        docs = list(self.view_col.find({}, {"_id": 0, "updated": 0}).sort("order", 1))
+        if not docs and self.services_col.estimated_document_count():
+            self.rebuild()
+            docs = list(self.view_col.find({}, {"_id": 0, "updated": 0}).sort("order", 1))
+        for d in docs:
+            d.pop("order", None)
+        return docs
@@ -0,0 +1,215 @@
+# db_indexes.py (declarative Mongo indexes + query-plan check for the hot queries)
+#
+#   python db_indexes.py            # create/verify every index (idempotent)
+#   python db_indexes.py --check    # also explain() each hot query; exit 1 on any COLLSCAN
+#
+# app.py applies INDEXES at startup (MONGO_ENSURE_INDEXES=0 turns that off).
+import os
+import sys
+import argparse
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError, OperationFailure
+from dotenv import load_dotenv
+
+# collection -> [(keys, options)]; every index is named so re-running is a no-op
+INDEXES = {
+    "services": [
+        ([("id", ASCENDING)], {"name": "id_unique", "unique": True}),
+        ([("category", ASCENDING)], {"name": "category"}),
+    ],
+    "categories": [
+        ([("id", ASCENDING)], {"name": "id_unique", "unique": True}),
+        ([("ministry_ids", ASCENDING)], {"name": "ministry_ids"}),
+    ],
+    "category_view": [
+        ([("id", ASCENDING)], {"name": "id_unique", "unique": True}),
+        ([("order", ASCENDING)], {"name": "order"}),
+        ([("ministries.id", ASCENDING)], {"name": "ministries_id"}),
+    ],
+    "officers": [
+        ([("id", ASCENDING)], {"name": "id_unique", "unique": True}),
+    ],
+    "ads": [
+        ([("id", ASCENDING)], {"name": "id_unique", "unique": True}),
+        ([("active", ASCENDING)], {"name": "active"}),
+    ],
+    "admins": [
+        ([("username", ASCENDING)], {"name": "username_unique", "unique": True}),
+    ],
+    "users": [
+        ([("email", ASCENDING)], {"name": "email_unique", "unique": True,
+                                  "partialFilterExpression": {"email": {"$type": "string"}}}),
+        ([("created", DESCENDING)], {"name": "created"}),
+        ([("last_active", DESCENDING)], {"name": "last_active"}),
+    ],
+    "engagements": [
+        ([("user_id", ASCENDING), ("timestamp", DESCENDING)], {"name": "user_timestamp"}),
+        # becomes a TTL index via apply_ttl(), once engagement_rollups.py has caught up
+        ([("timestamp", DESCENDING)], {"name": "timestamp"}),
+    ],
+    "engagement_rollups": [
+        ([("g", ASCENDING), ("t", ASCENDING), ("dim", ASCENDING), ("key", ASCENDING)], {"name": "bucket_unique", "unique": True}),
+        ([("dim", ASCENDING), ("g", ASCENDING), ("t", ASCENDING)], {"name": "dim_range"}),
+    ],
+    "engagement_counters": [
+        ([("day", ASCENDING), ("dim", ASCENDING), ("key", ASCENDING)], {"name": "bucket_unique", "unique": True}),
+        ([("dim", ASCENDING), ("day", ASCENDING)], {"name": "dim_day"}),
+    ],
+    "engagement_sketches": [
+        ([("day", ASCENDING)], {"name": "day"}),
+    ],
+    "products": [
+        ([("category", ASCENDING), ("price", ASCENDING)], {"name": "category_price"}),
+        ([("subcategory", ASCENDING)], {"name": "subcategory"}),
+        ([("tags", ASCENDING)], {"name": "tags"}),
+        ([("price", ASCENDING)], {"name": "price"}),
+        ([("rating", DESCENDING)], {"name": "rating"}),
+        # the store listing always filters on in_stock; without other filters this is its only index
+        ([("in_stock", ASCENDING)], {"name": "in_stock"}),
+    ],
+    "orders": [
+        ([("order_id", ASCENDING)], {"name": "order_id_unique", "unique": True}),
+        ([("user_id", ASCENDING), ("created", DESCENDING)], {"name": "user_created"}),
+    ],
+    "payments": [
+        ([("order_id", ASCENDING)], {"name": "order_id"}),
+        ([("status", ASCENDING)], {"name": "status"}),
+    ],
+}
+
+
+def hot_queries():
+    """(label, collection, filter, sort) for the queries the app actually runs, with their real shapes"""
+    now = datetime.utcnow()
+    week_ago = now - timedelta(days=7)
+    return [
+        ("service by id", "services", {"id": "x"}, None),
+        ("services of a category", "services", {"category": "x"}, None),
+        ("uncategorized services", "services", {"category": {"$in": [None, ""]}}, None),
+        ("services by ids", "services", {"id": {"$in": ["x", "y"]}}, None),
+        ("category by id", "categories", {"id": "x"}, None),
+        ("categories of a service", "categories",
+         {"$or": [{"ministry_ids": "x"}, {"id": "x", "ministry_ids": {"$in": [None, []]}}]}, None),
+        ("category view in order", "category_view", {}, [("order", 1)]),
+        ("category view by ministry", "category_view", {"ministries.id": "x"}, None),
+        ("officer by id", "officers", {"id": "x"}, None),
+        ("ad by id", "ads", {"id": "x"}, None),
+        ("active ads", "ads", {"active": True}, None),
+        ("admin login", "admins", {"username": "x"}, None),
+        ("user by email", "users", {"email": "x@example.com"}, None),
+        ("new users", "users", {"created": {"$gte": week_ago}}, None),
+        ("active users", "users", {"last_active": {"$gte": now - timedelta(days=30)}}, None),
+        ("latest engagements", "engagements", {}, [("timestamp", -1)]),
+        ("engagements of a user", "engagements", {"user_id": "x"}, None),
+        ("engagements of an hour", "engagements", {"timestamp": {"$gte": week_ago, "$lt": now}}, None),
+        ("oldest engagement", "engagements", {"timestamp": {"$ne": None}}, [("timestamp", 1)]),
+        ("rollups of an hour", "engagement_rollups", {"g": "hour", "t": week_ago}, None),
+        ("hour rollups of a day", "engagement_rollups", {"g": "hour", "t": {"$gte": week_ago, "$lt": now}}, None),
+        ("rollup series", "engagement_rollups",
+         {"g": "day", "dim": "total", "key": "all", "t": {"$gte": week_ago, "$lt": now}}, [("t", 1)]),
+        ("rollups of a dimension", "engagement_rollups",
+         {"dim": "service", "$or": [{"g": "hour", "t": {"$gte": week_ago, "$lt": now}},
+                                    {"g": "day", "t": {"$gte": week_ago, "$lt": now}}]}, None),
+        ("insight counters of a range", "engagement_counters", {"day": {"$gte": week_ago, "$lt": now}}, None),
+        ("insight counters of a day", "engagement_counters", {"day": week_ago}, None),
+        ("insight counters of a dimension", "engagement_counters",
+         {"dim": "service", "day": {"$gte": week_ago, "$lt": now}}, None),
+        ("sketches of a range", "engagement_sketches", {"day": {"$gte": week_ago, "$lt": now}}, None),
+        # get_products() always adds in_stock: True
+        ("products in stock", "products", {"in_stock": True}, None),
+        ("products by category + price", "products", {"in_stock": True, "category": "x", "price": {"$gte": 0, "$lte": 100}}, None),
+        ("products by categories", "products", {"in_stock": True, "category": {"$in": ["x", "y"]}}, None),
+        ("products by subcategory", "products", {"in_stock": True, "subcategory": "x"}, None),
+        ("products by tag", "products", {"in_stock": True, "tags": {"$in": ["x"]}}, None),
+        ("products by price", "products", {"in_stock": True, "price": {"$gte": 0}}, None),
+        ("top rated products", "products", {}, [("rating", -1)]),
+        ("order by order_id", "orders", {"order_id": "x"}, None),
+        ("completed payments", "payments", {"status": "completed"}, None),
+    ]
+
+
+def ensure_indexes(db, log=print):
+    """Create every index in INDEXES that is missing; returns {collection: [errors]}"""
+    errors = {}
+    for name, specs in INDEXES.items():
+        col = db[name]
+        try:
+            existing = col.index_information()
+        except PyMongoError:
+            existing = {}
+        for keys, options in specs:
+            if options["name"] in existing:
+                # names are stable, so an existing one is this index (possibly with a TTL added since)
+                continue
+            try:
+                col.create_index(keys, **options)
+            except PyMongoError as e:
+                # e.g. existing duplicates for a unique index; the rest still gets created
+                errors.setdefault(name, []).append(f"{options['name']}: {e}")
+                log(f"   ⚠️ index {name}.{options['name']} not created: {e}")
+    return errors
+
+
+def apply_ttl(col, keys, name, seconds):
+    """Make index `name` expire documents after `seconds`; returns False if it already does"""
+    info = col.index_information().get(name)
+    if info is not None and info.get("expireAfterSeconds") == seconds:
+        return False
+    if info is None:
+        col.create_index(keys, name=name, expireAfterSeconds=seconds)
+        return True
+    try:
+        col.database.command("collMod", col.name, index={"name": name, "expireAfterSeconds": seconds})
+    except OperationFailure:
+        # servers before 5.1 cannot turn a plain index into a TTL index in place
+        col.drop_index(name)
+        col.create_index(keys, name=name, expireAfterSeconds=seconds)
+    return True
+
+
+def plan_stages(plan):
+    stages = [plan.get("stage")]
+    for child in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(child), dict):
+            stages += plan_stages(plan[child])
+    for sub in plan.get("inputStages", []):
+        stages += plan_stages(sub)
+    return stages
+
+
+def check_query_plans(db):
+    """explain() every hot query; returns [(label, stages)] for those that scan a collection"""
+    failures = []
+    for label, name, query, sort in hot_queries():
+        cursor = db[name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = plan_stages(winning)
+        if "COLLSCAN" in stages:
+            failures.append((label, stages))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create Mongo indexes and check hot query plans")
+    parser.add_argument("--check", action="store_true", help="fail if a hot query does a COLLSCAN")
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/"))["citizen_portal"]
+    errors = ensure_indexes(db)
+    print(f"✅ {sum(len(s) for s in INDEXES.values())} indexes on {len(INDEXES)} collections ({sum(len(e) for e in errors.values())} errors)")
+    if not args.check:
+        sys.exit(1 if errors else 0)
+    failures = check_query_plans(db)
+    for label, _, _, _ in hot_queries():
+        bad = next((stages for l, stages in failures if l == label), None)
+        print(f"   {'❌' if bad else '✅'} {label}" + (f"  ({' <- '.join(bad)})" if bad else ""))
+    sys.exit(1 if failures or errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# embedding_cache.py (persistent content-hash -> vector cache for index builds)
+import os
+import uuid
+import hashlib
+import pathlib
+import threading
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Caches document embeddings keyed by hash(model name + content).
+    Stored as append-only segments per model: <slug>.<segment>.keys.npy (16-byte digests)
+    and <slug>.<segment>.vecs.npy (float32 rows), so a rebuild only encodes new or edited
+    texts and a miss only writes its own rows. compact() merges the segments into one,
+    optionally dropping entries no longer in use; it also runs by itself once there are
+    more than `max_segments`.
+    """
+
+    def __init__(self, model_name, cache_dir="data/embed_cache", max_segments=32):
+        self.model_name = model_name
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.slug = "".join(c if c.isalnum() else "_" for c in model_name)
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._rows = {}  # digest -> (segment name, row)
+        self._segments = {}  # segment name -> memory-mapped float32 rows
+        self.hits = 0
+        self.misses = 0
+        self.compactions = 0
+
+    def key(self, text):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(self.model_name.encode("utf-8"))
+        h.update(b"\0")
+        h.update(text.encode("utf-8"))
+        return h.digest()
+
+    def _paths(self, segment):
+        # segment "" is the single-file layout written before segments existed
+        stem = f"{self.slug}.{segment}." if segment else f"{self.slug}."
+        return self.cache_dir / f"{stem}keys.npy", self.cache_dir / f"{stem}vecs.npy"
+
+    def _segment_names(self):
+        names = []
+        for path in self.cache_dir.glob(f"{self.slug}.*keys.npy"):
+            parts = path.name[len(self.slug) + 1:].split(".")
+            if parts[-2:] == ["keys", "npy"] and len(parts) <= 3:
+                names.append(parts[0] if len(parts) == 3 else "")
+        return sorted(names)
+
+    def _refresh(self):
+        """Load segments written since the last call (by this or another process)"""
+        for name in self._segment_names():
+            if name in self._segments:
+                continue
+            keys_path, vecs_path = self._paths(name)
+            try:
+                keys = np.load(str(keys_path))
+                vecs = np.load(str(vecs_path), mmap_mode="r")
+            except (OSError, ValueError):
+                # removed by a compaction meanwhile, or not fully written yet
+                continue
+            if len(keys) != len(vecs):
+                continue
+            self._segments[name] = vecs
+            for i, k in enumerate(keys):
+                self._rows.setdefault(bytes(k), (name, i))
+
+    def _write_segment(self, keys, vecs):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        name = uuid.uuid4().hex[:12]
+        keys_path, vecs_path = self._paths(name)
+        # vectors first: a segment is only picked up once its keys file exists
+        for arr, path in ((vecs, vecs_path), (np.array(keys, dtype="S16"), keys_path)):
+            tmp = str(path) + ".tmp.npy"
+            np.save(tmp, arr)
+            os.replace(tmp, path)
+        self._segments[name] = np.load(str(vecs_path), mmap_mode="r")
+        for i, k in enumerate(keys):
+            self._rows[k] = (name, i)
+        return name
+
+    def _vectors(self, keys):
+        return np.array([self._segments[s][i] for s, i in (self._rows[k] for k in keys)], dtype=np.float32)
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._rows)
+
+    def encode(self, texts, encode_fn, progress=None, chunk_size=256):
+        """
+        Return an (n, dim) array for `texts`. `encode_fn(list_of_texts)` is only
+        called for texts that are not cached yet; their vectors are then persisted.
+        `progress(encoded, to_encode)` is called after every chunk of misses.
+        """
+        with self._lock:
+            keys = [self.key(t) for t in texts]
+            if any(k not in self._rows for k in keys):
+                self._refresh()
+            missing = {}
+            for k, t in zip(keys, texts):
+                if k not in self._rows and k not in missing:
+                    missing[k] = t
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+            if progress:
+                progress(0, len(missing))
+            if missing:
+                pending = list(missing.values())
+                chunks = []
+                for i in range(0, len(pending), chunk_size):
+                    chunks.append(np.asarray(encode_fn(pending[i:i + chunk_size]), dtype=np.float32))
+                    if progress:
+                        progress(min(i + chunk_size, len(pending)), len(pending))
+                self._write_segment(list(missing), np.vstack(chunks))
+                if len(self._segments) > self.max_segments:
+                    self._compact(None)
+            if not texts:
+                return np.zeros((0, 0), dtype=np.float32)
+            return self._vectors(keys)
+
+    def compact(self, keep_texts=None):
+        """Merge all segments into one; with `keep_texts`, only their entries are kept"""
+        with self._lock:
+            self._refresh()
+            return self._compact(None if keep_texts is None else {self.key(t) for t in keep_texts})
+
+    def _compact(self, keep):
+        old = list(self._segments)
+        keys = [k for k in self._rows if keep is None or k in keep]
+        if len(old) <= 1 and len(keys) == len(self._rows):
+            # already one segment with nothing to drop
+            return len(keys)
+        vecs = self._vectors(keys) if keys else None
+        self._rows, self._segments = {}, {}
+        if keys:
+            self._write_segment(keys, vecs)
+        for name in old:
+            for path in self._paths(name):
+                try:
+                    # other processes may still have it mapped; on Windows that makes this fail
+                    os.remove(path)
+                except OSError:
+                    pass
+        self.compactions += 1
+        return len(keys)
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            return {"entries": len(self._rows), "segments": len(self._segments), "hits": self.hits,
+                    "misses": self.misses, "compactions": self.compactions}
@@ -0,0 +1,50 @@
+# engagement_common.py (helpers shared by the engagement writer, counters, sketches and rollups)
+import time
+import threading
+import traceback
+
+
+def floor_day(t):
+    return t.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def scalar_key(value):
+    # events are keyed by scalars only (a stray object / list value is not counted)
+    return value if isinstance(value, (str, int, float)) and not isinstance(value, bool) else None
+
+
+def every(interval, fn):
+    """Thread target calling fn() every `interval` seconds; an exception is printed, not fatal"""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                fn()
+            except Exception:
+                traceback.print_exc()
+    return loop
+
+
+class LazyThread:
+    """
+    Daemon thread running `target`, started by the first ensure_started() call instead of
+    at import, so it lives in the serving process (not before a fork). Restarted if it died.
+    """
+
+    def __init__(self, target, name):
+        self.target = target
+        self.name = name
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.target, name=self.name, daemon=True)
+                self._thread.start()
+
+    @property
+    def started(self):
+        return self._thread is not None
@@ -0,0 +1,222 @@
+# engagement_counters.py (per-day insight counters, incremented as engagements arrive)
+#
+#   python engagement_counters.py --backfill                      # rebuild every past day from raw events
+#   python engagement_counters.py --backfill --since 2025-01-01   # only from that day on
+import os
+import atexit
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from engagement_common import floor_day, scalar_key as _key, every, LazyThread
+
+DAY = timedelta(days=1)
+# age buckets for insights: [lower, upper) -> label
+AGE_GROUPS = [(0, 18, "<18"), (18, 26, "18-25"), (26, 41, "26-40"), (41, 61, "41-60"), (61, 200, "60+")]
+# fields read from raw events by count_event() / the backfill
+EVENT_FIELDS = {"_id": 0, "timestamp": 1, "age": 1, "job": 1, "service": 1, "question_clicked": 1,
+                "desires": 1, "ad": 1}
+# dimensions count_event() produces; each has a bounded number of keys per day (no per-user keys:
+# repeated user/question pairs are heavy hitters in engagement_sketches.py instead)
+DIMENSIONS = ("total", "job", "service", "question", "age_group", "ad", "desire")
+
+
+def age_group(age):
+    if isinstance(age, bool) or not isinstance(age, (int, float)) or age <= 0:
+        return None
+    return next((label for lo, hi, label in AGE_GROUPS if lo <= age < hi), None)
+
+
+def count_event(e):
+    """[(dim, key)] an engagement contributes to, matching what /api/admin/insights reports"""
+    job = e.get("job").strip() if isinstance(e.get("job"), str) else ""
+    pairs = [
+        ("total", "all"),
+        ("job", job or "Unknown"),
+        ("service", _key(e.get("service")) or "Unknown"),
+        ("question", _key(e.get("question_clicked")) or "Unknown"),
+    ]
+    group = age_group(e.get("age"))
+    if group:
+        pairs.append(("age_group", group))
+    if _key(e.get("ad")) not in (None, ""):
+        pairs.append(("ad", e["ad"]))
+    desires = e.get("desires") if isinstance(e.get("desires"), list) else []
+    for d in desires:
+        if _key(d) is not None:
+            pairs.append(("desire", d))
+    return pairs
+
+
+class EngagementCounters:
+    """
+    Documents {day, dim, key, n} in `collection`. add() only bumps an in-memory dict; a
+    worker thread flushes it every `flush_interval` seconds as one unordered batch of $inc
+    upserts, so ingest cost does not depend on traffic and insights over any range read
+    O(days x keys) small documents instead of raw events.
+    """
+
+    def __init__(self, collection, flush_interval=5.0, meta_col=None):
+        self.collection = collection
+        # meta doc "engagement_counters": live_since (first live count), backfilled_until
+        self.meta_col = meta_col
+        self._live_since = None
+        self.flush_interval = max(0.1, float(flush_interval))
+        self._pending = {}  # (day, dim, key) -> n
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._worker = LazyThread(every(self.flush_interval, self.flush), "engagement-counters")
+        # metrics
+        self.counted = 0
+        self.flushes = 0
+        self.upserts = 0
+        self.errors = 0
+        self.last_error = None
+        atexit.register(self.flush)
+
+    def add(self, docs):
+        self._worker.ensure_started()
+        with self._lock:
+            if self._live_since is None:
+                self._live_since = datetime.utcnow()
+            for e in docs:
+                day = floor_day(e.get("timestamp") or datetime.utcnow())
+                for dim, key in count_event(e):
+                    self._pending[(day, dim, key)] = self._pending.get((day, dim, key), 0) + 1
+                self.counted += 1
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            items = list(pending.items())
+            ops = [UpdateOne({"day": day, "dim": dim, "key": key}, {"$inc": {"n": n}}, upsert=True)
+                   for (day, dim, key), n in items]
+            try:
+                self.collection.bulk_write(ops, ordered=False)
+                failed = []
+            except BulkWriteError as e:
+                # e.g. two processes upserting the same new counter; everything else was applied
+                failed = [items[err["index"]] for err in e.details.get("writeErrors", [])]
+                self.errors += 1
+                self.last_error = str(e)
+            except PyMongoError as e:
+                # nothing known to be applied: keep it all for the next flush
+                failed = items
+                self.errors += 1
+                self.last_error = str(e)
+            if failed:
+                with self._lock:
+                    for k, n in failed:
+                        self._pending[k] = self._pending.get(k, 0) + n
+            self.flushes += 1
+            self.upserts += len(items) - len(failed)
+            if self.meta_col is not None and len(failed) < len(items):
+                try:
+                    # everything from this moment on is counted live (earliest process wins)
+                    self.meta_col.update_one({"_id": "engagement_counters"},
+                                             {"$min": {"live_since": self._live_since}}, upsert=True)
+                except PyMongoError as e:
+                    self.last_error = str(e)
+            return len(items) - len(failed)
+
+    def summary(self, start, end, limit=20, dims=DIMENSIONS):
+        """{dim: [(key, n)]} for whole days in [start, end), most frequent first, `limit` per dim"""
+        result = {}
+        for dim in dims:
+            # one sorted + limited aggregation per dimension: the server keeps only the top
+            # `limit` keys while sorting, instead of collecting every key of the range
+            rows = self.collection.aggregate([
+                {"$match": {"dim": dim, "day": {"$gte": floor_day(start), "$lt": end}}},
+                {"$group": {"_id": "$key", "n": {"$sum": "$n"}}},
+                {"$sort": {"n": -1, "_id": 1}},
+                {"$limit": limit},
+            ], allowDiskUse=True)
+            result[dim] = [(r["_id"], r["n"]) for r in rows]
+        return result
+
+    def backfill(self, eng_col, since=None, until=None, log=print):
+        """
+        Recompute the counters of every day in [since, until) from raw events. Days are
+        replaced, so it is idempotent; `until` defaults to today, whose counters are still
+        being incremented live.
+        """
+        until = floor_day(until or datetime.utcnow())
+        full = since is None
+        if since is None:
+            first = eng_col.find_one({"timestamp": {"$ne": None}}, {"timestamp": 1}, sort=[("timestamp", 1)])
+            if not first:
+                return 0
+            since = first["timestamp"]
+        day = floor_day(since)
+        days = 0
+        while day < until:
+            counts = {}
+            for e in eng_col.find({"timestamp": {"$gte": day, "$lt": day + DAY}}, EVENT_FIELDS):
+                for dim, key in count_event(e):
+                    counts[(dim, key)] = counts.get((dim, key), 0) + 1
+            self.collection.delete_many({"day": day})
+            if counts:
+                self.collection.insert_many([{"day": day, "dim": dim, "key": key, "n": n}
+                                             for (dim, key), n in counts.items()])
+            log(f"   {day.date()}: {counts.get(('total', 'all'), 0)} events")
+            days += 1
+            day += DAY
+        if full and self.meta_col is not None:
+            # every event before `until` is now counted (see history_complete)
+            self.meta_col.update_one({"_id": "engagement_counters"}, {"$max": {"backfilled_until": until}}, upsert=True)
+        return days
+
+    def history_complete(self, eng_col):
+        """True once every stored raw event is reflected in the counters (live or backfilled)"""
+        first = eng_col.find_one({"timestamp": {"$ne": None}}, {"timestamp": 1}, sort=[("timestamp", 1)])
+        if first is None:
+            return True
+        state = (self.meta_col.find_one({"_id": "engagement_counters"}) if self.meta_col is not None else None) or {}
+        live_since = state.get("live_since")
+        if live_since is None:
+            return False
+        return first["timestamp"] >= live_since or state.get("backfilled_until", datetime.min) >= live_since
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "counted": self.counted,
+            "flushes": self.flushes,
+            "upserts": self.upserts,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build per-day engagement counters from raw events")
+    parser.add_argument("--backfill", action="store_true", help="recompute past days from the engagements collection")
+    parser.add_argument("--since", help="first day (YYYY-MM-DD); default: the oldest engagement")
+    parser.add_argument("--until", help="day to stop before (YYYY-MM-DD); default: today")
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.print_help()
+        return
+
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/"))["citizen_portal"]
+    counters = EngagementCounters(db["engagement_counters"], meta_col=db["meta"])
+    days = counters.backfill(
+        db["engagements"],
+        since=datetime.fromisoformat(args.since) if args.since else None,
+        until=datetime.fromisoformat(args.until) if args.until else None,
+    )
+    print(f"✅ Rebuilt counters for {days} days")
+
+
+if __name__ == "__main__":
+    main()
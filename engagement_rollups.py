@@ -0,0 +1,253 @@
+# engagement_rollups.py (hourly / daily engagement rollups kept after raw events expire)
+import os
+import time
+import socket
+import traceback
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne, ReturnDocument, DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from db_indexes import apply_ttl
+from engagement_common import floor_day, LazyThread
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+# dimension -> raw engagement field; "total" counts every event
+DIMENSIONS = {
+    "service": "$service",
+    "question": "$question_clicked",
+    "ad": "$ad",
+    "source": "$source",
+    "type": "$type",
+}
+
+
+def floor_hour(t):
+    return t.replace(minute=0, second=0, microsecond=0)
+
+
+class EngagementRollups:
+    """
+    Rollup documents {g: "hour"|"day", t: bucket start, dim, key, n} in `rollup_col`.
+    Hours are recomputed from raw events (idempotent, so the still-open hour is simply
+    redone next run); days are summed from their hours. Raw events can then expire via
+    the TTL index while range queries read at most a few hundred small documents.
+    Every run also redoes the `lag_hours` before its checkpoint, so events that arrive
+    late (batching, a spill file replayed after an outage) still get counted.
+    """
+
+    def __init__(self, eng_col, rollup_col, meta_col, ttl_days=0, ttl_ready=None, lag_hours=6):
+        self.eng_col = eng_col
+        self.rollup_col = rollup_col
+        self.meta_col = meta_col
+        # raw events get a TTL only once everything older than it has been rolled up and
+        # ttl_ready() (other consumers of raw history, e.g. the counter backfill) agrees
+        self.ttl_days = float(ttl_days or 0)
+        self.ttl_ready = ttl_ready
+        self.ttl_state = "off" if self.ttl_days <= 0 else "pending"
+        self.lag = timedelta(hours=max(float(lag_hours or 0), 0))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.last_run = None
+        self.last_error = None
+        self.interval = 300
+        self._worker = LazyThread(self._loop, "engagement-rollups")
+
+    def _replace(self, g, t, counts):
+        """Make the stored rollup for bucket (g, t) exactly `counts` {(dim, key): n}"""
+        ops = [UpdateOne({"g": g, "t": t, "dim": dim, "key": key}, {"$set": {"n": n}}, upsert=True)
+               for (dim, key), n in counts.items()]
+        if ops:
+            self.rollup_col.bulk_write(ops, ordered=False)
+        stale = [{"dim": dim, "key": key} for dim, key in counts]
+        query = {"g": g, "t": t}
+        if stale:
+            query["$nor"] = stale
+        self.rollup_col.delete_many(query)
+
+    def rollup_hour(self, start):
+        facets = {dim: [{"$group": {"_id": field, "n": {"$sum": 1}}}] for dim, field in DIMENSIONS.items()}
+        facets["total"] = [{"$count": "n"}]
+        result = list(self.eng_col.aggregate([
+            {"$match": {"timestamp": {"$gte": start, "$lt": start + HOUR}}},
+            {"$facet": facets},
+        ]))
+        counts = {}
+        for dim, rows in (result[0] if result else {}).items():
+            for row in rows:
+                if dim == "total":
+                    counts[("total", "all")] = row["n"]
+                elif row["_id"] not in (None, "") and not isinstance(row["_id"], (dict, list)):
+                    counts[(dim, row["_id"])] = row["n"]
+        self._replace("hour", start, counts)
+        return counts.get(("total", "all"), 0)
+
+    def rollup_day(self, day):
+        rows = self.rollup_col.aggregate([
+            {"$match": {"g": "hour", "t": {"$gte": day, "$lt": day + DAY}}},
+            {"$group": {"_id": {"dim": "$dim", "key": "$key"}, "n": {"$sum": "$n"}}},
+        ])
+        self._replace("day", day, {(r["_id"]["dim"], r["_id"]["key"]): r["n"] for r in rows})
+
+    def _lease(self, seconds):
+        """Only one process rolls up at a time (they would fight over the same buckets)"""
+        now = datetime.utcnow()
+        try:
+            doc = self.meta_col.find_one_and_update(
+                {"_id": "engagement_rollups", "$or": [{"lease_until": {"$lt": now}}, {"owner": self.owner}]},
+                {"$set": {"lease_until": now + timedelta(seconds=seconds), "owner": self.owner}},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # the doc exists and someone else holds the lease
+            return None
+        return doc
+
+    def _checkpoint(self, hour, lease_seconds):
+        """Save progress and renew the lease; False if another process took the lease over"""
+        now = datetime.utcnow()
+        result = self.meta_col.update_one(
+            {"_id": "engagement_rollups", "owner": self.owner},
+            {"$set": {"hour": hour, "lease_until": now + timedelta(seconds=lease_seconds), "updated": now}},
+        )
+        return result.matched_count == 1
+
+    def _release(self):
+        self.meta_col.update_one({"_id": "engagement_rollups", "owner": self.owner},
+                                 {"$set": {"lease_until": datetime.utcnow()}})
+
+    def run(self, now=None, lease_seconds=600):
+        """Roll up every hour since the last run minus the lag (up to and including the current one)"""
+        now = now or datetime.utcnow()
+        state = self._lease(lease_seconds)
+        if state is None:
+            return None
+        try:
+            start = state.get("hour")
+            if start is None:
+                first = self.eng_col.find_one({"timestamp": {"$ne": None}}, {"timestamp": 1}, sort=[("timestamp", 1)])
+                start = floor_hour(first["timestamp"]) if first else floor_hour(now)
+            else:
+                # rollup_hour is idempotent: redoing the trailing hours picks up late events
+                start = floor_hour(start - self.lag)
+            expire = self.eng_col.index_information().get("timestamp", {}).get("expireAfterSeconds")
+            if expire is not None:
+                # raw events already expire, so older hours may be partly gone: keep their rollups
+                if self.ttl_days > 0 and expire == int(self.ttl_days * 86400):
+                    self.ttl_state = "applied"
+                start = max(start, floor_hour(now - timedelta(seconds=expire)) + HOUR)
+            current = floor_hour(now)
+            hour = start
+            hours = events = days = 0
+            while hour <= current:
+                day = floor_day(hour)
+                while hour <= current and floor_day(hour) == day:
+                    events += self.rollup_hour(hour)
+                    hours += 1
+                    hour += HOUR
+                self.rollup_day(day)
+                days += 1
+                # saved per day, so a restart or another worker resumes here instead of
+                # redoing the whole catch-up; the current hour is still filling up, so the
+                # next run starts from it again
+                if not self._checkpoint(min(hour, current), lease_seconds):
+                    return None
+            # caught up: everything older than now - TTL has been rolled up
+            self._apply_ttl()
+            self.last_run = datetime.utcnow()
+            return {"hours": hours, "days": days, "events": events}
+        finally:
+            self._release()
+
+    def _apply_ttl(self):
+        if self.ttl_state != "pending":
+            return
+        if self.ttl_ready is not None and not self.ttl_ready():
+            return
+        apply_ttl(self.eng_col, [("timestamp", DESCENDING)], "timestamp", int(self.ttl_days * 86400))
+        self.ttl_state = "applied"
+
+    def _loop(self):
+        while True:
+            try:
+                self.run()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                traceback.print_exc()
+            time.sleep(self.interval)
+
+    def start(self, interval=300):
+        """Run every `interval` seconds on a daemon thread (started once)"""
+        self.interval = interval
+        self._worker.ensure_started()
+
+    def _range_match(self, start, end):
+        """Whole days from day rollups, the ragged edges from hour rollups"""
+        start = floor_hour(start)
+        end = floor_hour(end) + (HOUR if end != floor_hour(end) else timedelta(0))
+        first_day = floor_day(start) + (DAY if start != floor_day(start) else timedelta(0))
+        last_day = floor_day(end)
+        if first_day >= last_day:
+            return {"g": "hour", "t": {"$gte": start, "$lt": end}}
+        return {"$or": [
+            {"g": "hour", "t": {"$gte": start, "$lt": first_day}},
+            {"g": "day", "t": {"$gte": first_day, "$lt": last_day}},
+            {"g": "hour", "t": {"$gte": last_day, "$lt": end}},
+        ]}
+
+    def top(self, dim, start, end, limit=10):
+        """[(key, count)] for `dim` between `start` and `end`, most frequent first"""
+        rows = self.rollup_col.aggregate([
+            {"$match": {"dim": dim, **self._range_match(start, end)}},
+            {"$group": {"_id": "$key", "n": {"$sum": "$n"}}},
+            {"$sort": {"n": -1}},
+            {"$limit": limit},
+        ])
+        return [(r["_id"], r["n"]) for r in rows]
+
+    def total(self, start=None, end=None):
+        if start is None:
+            # all history: every day rollup plus the hours of the (unfinished) current day
+            day = floor_day(datetime.utcnow())
+            match = {"dim": "total", "$or": [{"g": "day", "t": {"$lt": day}}, {"g": "hour", "t": {"$gte": day}}]}
+        else:
+            match = {"dim": "total", **self._range_match(start, end or datetime.utcnow())}
+        rows = list(self.rollup_col.aggregate([{"$match": match}, {"$group": {"_id": None, "n": {"$sum": "$n"}}}]))
+        return rows[0]["n"] if rows else 0
+
+    def series(self, start, end, granularity="day", dim="total", key="all"):
+        """[(bucket start, count)] for one key of `dim`"""
+        rows = self.rollup_col.find(
+            {"g": granularity, "dim": dim, "key": key, "t": {"$gte": start, "$lt": end}},
+            {"_id": 0, "t": 1, "n": 1},
+        ).sort("t", 1)
+        return [(r["t"], r["n"]) for r in rows]
+
+    def stats(self):
+        state = self.meta_col.find_one({"_id": "engagement_rollups"}) or {}
+        return {
+            "rolled_up_to": state.get("hour").isoformat() if state.get("hour") else None,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "raw_event_ttl": self.ttl_state,
+            "last_error": self.last_error,
+        }
+
+
+if __name__ == "__main__":
+    # one-off / cron run: python engagement_rollups.py
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/"))["citizen_portal"]
+    from engagement_counters import EngagementCounters
+
+    counters = EngagementCounters(db["engagement_counters"], meta_col=db["meta"])
+    result = EngagementRollups(
+        db["engagements"], db["engagement_rollups"], db["meta"],
+        ttl_days=float(os.getenv("ENGAGEMENT_TTL_DAYS", 90)),
+        ttl_ready=lambda: counters.history_complete(db["engagements"]),
+        lag_hours=float(os.getenv("ENGAGEMENT_ROLLUP_LAG_HOURS", 6)),
+    ).run()
+    print(f"✅ Rolled up {result}" if result else "⚠️ Another process holds the rollup lease")
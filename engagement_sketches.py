@@ -0,0 +1,292 @@
+# engagement_sketches.py (per-day unique-user / heavy-hitter sketches fed from engagement ingest)
+import os
+import re
+import copy
+import json
+import time
+import uuid
+import atexit
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from engagement_common import floor_day, scalar_key, every, LazyThread
+from sketches import HyperLogLog, TopK, CountMinSketch
+
+# heavy-hitter dimension -> raw engagement field
+HEAVY_HITTERS = {"question": "question_clicked", "service": "service", "ad": "ad"}
+# plus repeated (user, question) pairs, the "premium suggestions": a constant-size top-k per
+# day instead of one counter per distinct pair
+PAIRS = "user_question"
+# owner of the one compacted document per finished day
+MERGED = "merged"
+
+
+def pair_key(user, question):
+    # one scalar key (sketch candidates are stored as a BSON array of keys)
+    return json.dumps([user, question])
+
+
+class DaySketch:
+    """Everything sketched for one day: distinct users / sessions and heavy hitters"""
+
+    def __init__(self, p, width, depth, k):
+        self.params = {"p": p, "width": width, "depth": depth, "k": k}
+        self.events = 0
+        self.users = HyperLogLog(p)
+        self.sessions = HyperLogLog(p)
+        self.heavy = {dim: TopK(k, width, depth) for dim in (*HEAVY_HITTERS, PAIRS)}
+
+    def add(self, e):
+        self.events += 1
+        user = scalar_key(e.get("user_id"))
+        if user not in (None, ""):
+            self.users.add(user)
+            question = scalar_key(e.get("question_clicked"))
+            self.heavy[PAIRS].add(pair_key(user, question if question != "" else None))
+        if scalar_key(e.get("session_id")) not in (None, ""):
+            self.sessions.add(e["session_id"])
+        for dim, field in HEAVY_HITTERS.items():
+            key = scalar_key(e.get(field))
+            if key not in (None, ""):
+                self.heavy[dim].add(key)
+
+    def merge(self, other):
+        self.events += other.events
+        self.users.merge(other.users)
+        self.sessions.merge(other.sessions)
+        for dim in self.heavy:
+            self.heavy[dim].merge(other.heavy[dim])
+        return self
+
+    def to_doc(self):
+        return {
+            "params": self.params,
+            "events": self.events,
+            "users": self.users.to_bytes(),
+            "sessions": self.sessions.to_bytes(),
+            "heavy": {dim: {"cms": t.cms.to_bytes(), "keys": list(t.candidates)} for dim, t in self.heavy.items()},
+        }
+
+    @classmethod
+    def from_doc(cls, doc):
+        p, width, depth, k = (doc["params"][n] for n in ("p", "width", "depth", "k"))
+        sketch = cls(p, width, depth, k)
+        sketch.events = doc.get("events", 0)
+        sketch.users = HyperLogLog.from_bytes(p, doc["users"])
+        sketch.sessions = HyperLogLog.from_bytes(p, doc["sessions"])
+        for dim, h in doc.get("heavy", {}).items():
+            if dim in sketch.heavy:
+                sketch.heavy[dim] = TopK(k, cms=CountMinSketch.from_bytes(width, depth, h["cms"]), keys=h["keys"])
+        return sketch
+
+
+class EngagementSketches:
+    """
+    Each process sketches the events it ingests into one DaySketch per day and stores it
+    every `flush_interval` seconds as its own document ({day, owner}) in `collection`, so
+    processes never contend on a document. Reads merge every document of the requested
+    days (plus this process's unflushed state): constant memory per day, approximate
+    answers with the error bounds documented in sketches.py. Every `compact_interval`
+    seconds, one process merges the settled documents of finished days into a single
+    document per day (compact()).
+    """
+
+    def __init__(self, collection, p=14, width=2048, depth=5, k=64, flush_interval=30.0, compact_interval=3600.0):
+        self.collection = collection
+        self.params = (p, width, depth, k)
+        self.flush_interval = max(0.1, float(flush_interval))
+        self.compact_interval = float(compact_interval)
+        # a past day's document is final once its owner left it alone this long (see compact)
+        self.settle = max(3600.0, 10 * self.flush_interval)
+        # start time too: a restarted process with a recycled pid must not overwrite old state
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{int(time.time())}"
+        self._days = {}  # day -> DaySketch
+        self._doc_ids = {}  # day -> _id of the document its DaySketch is stored as
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._worker = LazyThread(every(self.flush_interval, self.flush), "engagement-sketches")
+        self._compacted = time.monotonic()
+        self.flushes = 0
+        self.compactions = 0
+        self.errors = 0
+        self.skipped = 0
+        self.last_error = None
+        atexit.register(self.flush)
+
+    def add(self, docs):
+        self._worker.ensure_started()
+        with self._lock:
+            for e in docs:
+                day = floor_day(e.get("timestamp") or datetime.utcnow())
+                if day not in self._days:
+                    self._days[day] = DaySketch(*self.params)
+                    # a day dropped from memory and revisited by late events gets a new
+                    # document, so a stored (or already compacted) one is never overwritten
+                    self._doc_ids[day] = f"{day:%Y-%m-%d}:{self.owner}:{uuid.uuid4().hex[:6]}"
+                self._days[day].add(e)
+                self._dirty.add(day)
+
+    def flush(self):
+        with self._lock:
+            # serialized under the lock, written outside it
+            docs = {day: (self._doc_ids[day], self._days[day].to_doc()) for day in self._dirty}
+            self._dirty = set()
+        written = 0
+        for day, (doc_id, doc) in docs.items():
+            try:
+                self.collection.replace_one(
+                    {"_id": doc_id},
+                    {**doc, "day": day, "owner": self.owner, "updated": datetime.utcnow()},
+                    upsert=True,
+                )
+                written += 1
+            except PyMongoError as e:
+                self.errors += 1
+                self.last_error = str(e)
+                with self._lock:
+                    self._dirty.add(day)
+        with self._lock:
+            # finished days that are safely stored no longer need to stay in memory
+            today = floor_day(datetime.utcnow())
+            for day in [d for d in self._days if d < today and d not in self._dirty]:
+                del self._days[day]
+                del self._doc_ids[day]
+        self.flushes += 1
+        if time.monotonic() - self._compacted >= self.compact_interval:
+            self._compacted = time.monotonic()
+            try:
+                self.compact()
+            except PyMongoError as e:
+                self.errors += 1
+                self.last_error = str(e)
+        return written
+
+    def compact(self, now=None, lease_seconds=600):
+        """
+        Merge the documents of each finished day into one ({day}:merged). Only documents
+        their owner has not written for `settle` seconds are merged: an owner drops a past
+        day from memory at the first flush after storing it, and sends later events to a
+        new document. The merged document lists its sources, so readers skip any that a
+        crash left behind. Returns the number of days merged, or None if another process
+        is compacting.
+        """
+        now = now or datetime.utcnow()
+        try:
+            self.collection.find_one_and_update(
+                {"_id": "compaction_lease", "lease_until": {"$lt": now}},
+                {"$set": {"lease_until": now + timedelta(seconds=lease_seconds), "owner": self.owner}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return None
+        params = dict(zip(("p", "width", "depth", "k"), self.params))
+        cutoff = now - timedelta(seconds=self.settle)
+        merged_days = 0
+        try:
+            days = self.collection.distinct(
+                "day", {"day": {"$lt": floor_day(now)}, "owner": {"$ne": MERGED}, "updated": {"$lt": cutoff}})
+            for day in days:
+                docs = list(self.collection.find({"day": day, "$or": [{"owner": MERGED}, {"updated": {"$lt": cutoff}}]}))
+                prior = next((d for d in docs if d.get("owner") == MERGED), None)
+                if prior is not None and prior.get("params") != params:
+                    self.skipped += 1
+                    continue
+                done = set(prior.get("sources", [])) if prior else set()
+                sources = [d for d in docs if d.get("owner") != MERGED and d["_id"] not in done and d.get("params") == params]
+                leftovers = [d["_id"] for d in docs if d["_id"] in done]
+                if not sources and not leftovers:
+                    continue
+                total = DaySketch.from_doc(prior) if prior else DaySketch(*self.params)
+                for doc in sources:
+                    total.merge(DaySketch.from_doc(doc))
+                ids = [d["_id"] for d in sources] + leftovers
+                self.collection.replace_one(
+                    {"_id": f"{day:%Y-%m-%d}:{MERGED}"},
+                    {**total.to_doc(), "day": day, "owner": MERGED, "sources": ids, "updated": now},
+                    upsert=True,
+                )
+                self.collection.delete_many({"_id": {"$in": ids}})
+                merged_days += 1
+        finally:
+            self.collection.update_one({"_id": "compaction_lease", "owner": self.owner},
+                                       {"$set": {"lease_until": datetime.utcnow()}})
+        self.compactions += 1
+        return merged_days
+
+    def merged(self, start, end):
+        """One DaySketch for the days in [start, end), or None when nothing was recorded"""
+        start = floor_day(start)
+        with self._lock:
+            # this process's live state; its stored documents may lag behind
+            live = {day: copy.deepcopy(s) for day, s in self._days.items() if start <= day < end}
+            live_ids = {self._doc_ids[day] for day in live}
+        params = dict(zip(("p", "width", "depth", "k"), self.params))
+        sketches = list(live.values())
+        docs = list(self.collection.find({"day": {"$gte": start, "$lt": end}}))
+        # sources of a compacted day that were not deleted yet
+        merged_ids = {i for doc in docs if doc.get("owner") == MERGED for i in doc.get("sources", [])}
+        for doc in docs:
+            if doc["_id"] in live_ids or doc["_id"] in merged_ids:
+                continue
+            if doc.get("params") != params:
+                # written with other SKETCH_* settings; sketches of different shape cannot merge
+                self.skipped += 1
+                continue
+            sketches.append(DaySketch.from_doc(doc))
+        if not sketches:
+            return None
+        total = sketches[0]
+        for sketch in sketches[1:]:
+            total.merge(sketch)
+        return total
+
+    def summary(self, start, end, limit=10):
+        sketch = self.merged(start, end)
+        if sketch is None:
+            sketch = DaySketch(*self.params)
+        probability = sketch.heavy["question"].cms.error_bound()[1]
+        return {
+            "events": sketch.events,
+            "unique_users": sketch.users.count(),
+            "unique_sessions": sketch.sessions.count(),
+            "top": {dim: [{"key": k, "estimate": n} for k, n in t.top(limit)]
+                    for dim, t in sketch.heavy.items() if dim != PAIRS},
+            # pairs seen at least twice (estimates never undercount)
+            "repeated_pairs": [{"user": user, "question": question, "estimate": n}
+                               for (user, question), n in ((json.loads(k), n) for k, n in sketch.heavy[PAIRS].top(limit))
+                               if n >= 2],
+            "error_bounds": {
+                "unique_relative_standard_error": round(float(sketch.users.standard_error()), 4),
+                # per heavy-hitter estimate: true count <= estimate <= true count + this, per dimension N
+                "top_max_overestimate": {dim: round(t.cms.error_bound()[0], 1) for dim, t in sketch.heavy.items()},
+                "top_bound_probability": round(probability, 4),
+            },
+        }
+
+    def forget_user(self, user_id):
+        """Drop `user_id` from the stored pair candidates (GDPR deletion; the Count-Min cells only hold hashes)"""
+        prefix = "[" + json.dumps(user_id) + ","
+        with self._lock:
+            for sketch in self._days.values():
+                pairs = sketch.heavy[PAIRS].candidates
+                for key in [k for k in pairs if k.startswith(prefix)]:
+                    del pairs[key]
+        return self.collection.update_many(
+            {f"heavy.{PAIRS}.keys": {"$regex": "^" + re.escape(prefix)}},
+            {"$pull": {f"heavy.{PAIRS}.keys": {"$regex": "^" + re.escape(prefix)}}},
+        ).modified_count
+
+    def stats(self):
+        return {
+            "owner": self.owner,
+            "days_in_memory": len(self._days),
+            "dirty_days": len(self._dirty),
+            "flushes": self.flushes,
+            "compactions": self.compactions,
+            "skipped_documents": self.skipped,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,312 @@
+# engagement_writer.py (buffered, batched writes for engagement events)
+import os
+import re
+import time
+import uuid
+import atexit
+import socket
+import threading
+import traceback
+from collections import deque
+
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from engagement_common import LazyThread
+
+
+class IngestQueueFullError(Exception):
+    """Raised when the engagement queue is full and there is no spill file to fall back on"""
+
+
+def _process_alive(pid):
+    if os.name == "nt":
+        # os.kill(pid, 0) would terminate it there; leave other processes' files alone
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # exists, owned by another user
+        return True
+    return True
+
+
+class EngagementWriter:
+    """
+    Request handlers hand events to `submit()` and return immediately; a worker thread
+    writes them with unordered insert_many every `batch_size` events or `flush_interval`
+    seconds. If Mongo is unavailable (or the queue is full) and `spill_path` is set,
+    events are appended to a JSON-lines file and replayed once writes succeed again.
+    Events get their _id up front, so a replayed batch never inserts duplicates.
+
+    Each process spills to its own file (spill_path with "<host>-<pid>" before the
+    extension), so workers never interleave lines or replay the same file; files left by
+    processes of this host that no longer run are adopted and replayed. Lines that do not
+    decode (e.g. the last one of a crash mid-spill) go to a ".bad" file instead of
+    blocking the replay.
+    """
+
+    def __init__(self, collection, batch_size=500, flush_interval=1.0, max_queue=50000, spill_path=None):
+        self.collection = collection
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.01, float(flush_interval))
+        self.max_queue = int(max_queue)
+        self.spill_path = spill_path or None
+        self._adopted_at = 0.0
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._spill_lock = threading.Lock()
+        self._worker = LazyThread(self._run, "engagement-writer")
+        self._closed = False
+        self._inflight = 0
+        self._flush_waiters = 0
+        # metrics
+        self.accepted = 0
+        self.written = 0
+        self.batches = 0
+        self.rejected = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.bad_lines = 0
+        self.errors = 0
+        self.last_error = None
+        atexit.register(self.close)
+
+    def submit(self, doc):
+        return self.submit_many([doc])
+
+    def submit_many(self, docs):
+        """Queue events for writing; raises IngestQueueFullError when backpressure applies"""
+        docs = list(docs)
+        for d in docs:
+            d.setdefault("_id", ObjectId())
+        self._worker.ensure_started()
+        with self._cond:
+            if len(self._queue) + len(docs) > self.max_queue:
+                full = True
+            else:
+                full = False
+                self._queue.extend(docs)
+                self.accepted += len(docs)
+                if len(self._queue) >= self.batch_size:
+                    self._cond.notify()
+        if full:
+            if not self.spill_path:
+                self.rejected += len(docs)
+                raise IngestQueueFullError("engagement queue is full")
+            self._spill(docs)
+            self.accepted += len(docs)
+        return len(docs)
+
+    def _take(self):
+        with self._cond:
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._queue) < self.batch_size and not self._closed and not self._flush_waiters:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(self.batch_size, len(self._queue))
+            batch = [self._queue.popleft() for _ in range(n)]
+            self._inflight = len(batch)
+            return batch
+
+    def _insert(self, batch):
+        try:
+            self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # duplicate _ids are events already written by an earlier (replayed) attempt
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+            if e.details.get("writeConcernErrors"):
+                raise
+
+    def _write(self, batch):
+        try:
+            self._insert(batch)
+        except PyMongoError as e:
+            self.errors += 1
+            self.last_error = str(e)
+            if self.spill_path:
+                self._spill(batch)
+            else:
+                # keep the events and retry on the next tick; the queue limit applies backpressure
+                with self._cond:
+                    self._queue.extendleft(reversed(batch))
+                time.sleep(self.flush_interval)
+            return False
+        self.written += len(batch)
+        self.batches += 1
+        return True
+
+    def _run(self):
+        try:
+            # events spilled by an earlier run
+            self._replay()
+        except Exception:
+            traceback.print_exc()
+        while True:
+            batch = self._take()
+            try:
+                if batch and self._write(batch):
+                    self._replay()
+            except Exception:
+                traceback.print_exc()
+            finally:
+                with self._cond:
+                    self._inflight = 0
+                    self._cond.notify_all()
+            if self._closed and not self._queue:
+                return
+
+    def _own_spill(self):
+        # decided at spill time, not in __init__: the writer may be created before a fork
+        root, ext = os.path.splitext(self.spill_path)
+        return f"{root}.{socket.gethostname()}-{os.getpid()}{ext}"
+
+    def _spill_files(self):
+        """(path, host, pid) of every per-process spill / replay file next to spill_path"""
+        directory = os.path.dirname(os.path.abspath(self.spill_path))
+        root, ext = os.path.splitext(os.path.basename(self.spill_path))
+        pattern = re.compile(rf"{re.escape(root)}\.(.+)-(\d+){re.escape(ext)}(\.replay-\w+)?$")
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return []
+        return [(os.path.join(directory, n), m.group(1), int(m.group(2)))
+                for n, m in ((n, pattern.match(n)) for n in names) if m]
+
+    def _adopt_orphans(self, own):
+        """Claim spill files of dead processes on this host (and the old shared file)"""
+        orphans = [p for p in (self.spill_path, self.spill_path + ".replay") if os.path.exists(p)]
+        host = socket.gethostname()
+        for path, owner_host, pid in self._spill_files():
+            if owner_host == host and pid != os.getpid() and not _process_alive(pid):
+                orphans.append(path)
+        for path in orphans:
+            try:
+                # a rename is atomic: if two workers adopt the same file, one of them gets it
+                os.replace(path, f"{own}.replay-{uuid.uuid4().hex[:8]}")
+            except OSError:
+                pass
+
+    def _spill(self, docs):
+        with self._spill_lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+            with open(self._own_spill(), "a", encoding="utf-8") as f:
+                for d in docs:
+                    f.write(json_util.dumps(d) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self.spilled += len(docs)
+
+    def _replay(self):
+        """Write spilled events back to Mongo (called after a successful insert)"""
+        if not self.spill_path:
+            return
+        own = self._own_spill()
+        with self._spill_lock:
+            if time.monotonic() - self._adopted_at > 60:
+                self._adopted_at = time.monotonic()
+                self._adopt_orphans(own)
+            if os.path.exists(own) and os.path.getsize(own):
+                os.replace(own, f"{own}.replay-{uuid.uuid4().hex[:8]}")
+        directory = os.path.dirname(os.path.abspath(own))
+        prefix = os.path.basename(own) + ".replay-"
+        for name in sorted(os.listdir(directory)):
+            if name.startswith(prefix) and not self._replay_file(os.path.join(directory, name)):
+                return
+
+    def _replay_file(self, path):
+        batch, bad = [], []
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        batch.append(json_util.loads(line))
+                    except ValueError:
+                        # e.g. the truncated last line of a crash mid-spill: set aside, keep going
+                        bad.append(line if line.endswith("\n") else line + "\n")
+                        continue
+                    if len(batch) >= self.batch_size:
+                        self._insert(batch)
+                        self.replayed += len(batch)
+                        batch = []
+            if batch:
+                self._insert(batch)
+                self.replayed += len(batch)
+        except PyMongoError as e:
+            # the whole file is retried after the next successful write
+            self.errors += 1
+            self.last_error = str(e)
+            return False
+        if bad:
+            root, ext = os.path.splitext(self.spill_path)
+            with open(f"{root}.bad{ext}", "a", encoding="utf-8") as f:
+                f.write("".join(bad))
+            self.bad_lines += len(bad)
+        os.remove(path)
+        return True
+
+    def flush(self, timeout=10):
+        """Wait until everything queued so far has been written (or spilled)"""
+        self._worker.ensure_started()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._flush_waiters += 1
+            try:
+                self._cond.notify_all()
+                while (self._queue or self._inflight) and time.monotonic() < deadline:
+                    self._cond.wait(min(0.05, max(0.0, deadline - time.monotonic())))
+                return not self._queue and not self._inflight
+            finally:
+                self._flush_waiters -= 1
+
+    def close(self, timeout=10):
+        """Flush and stop the worker (registered with atexit)"""
+        if self._closed:
+            return
+        if not self._worker.started:
+            self._closed = True
+            return
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._queue and self.spill_path:
+            # Mongo did not take them in time: keep them on disk for the next start
+            with self._cond:
+                rest = list(self._queue)
+                self._queue.clear()
+            self._spill(rest)
+
+    def stats(self):
+        spill_bytes = 0
+        if self.spill_path:
+            # every worker's files: they all end up replayed by one of them
+            for path, _, _ in self._spill_files():
+                try:
+                    spill_bytes += os.path.getsize(path)
+                except OSError:
+                    pass
+        return {
+            "batch_size": self.batch_size,
+            "flush_interval_ms": self.flush_interval * 1000.0,
+            "max_queue": self.max_queue,
+            "queue_depth": len(self._queue),
+            "accepted": self.accepted,
+            "written": self.written,
+            "batches": self.batches,
+            "avg_batch_size": round(self.written / self.batches, 2) if self.batches else 0,
+            "rejected": self.rejected,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "bad_lines": self.bad_lines,
+            "spill_bytes": spill_bytes,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
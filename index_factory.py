@@ -0,0 +1,132 @@
+# index_factory.py (choose + build the FAISS index type for the AI search catalog)
+import os
+import math
+
+import numpy as np
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except Exception:
+    FAISS_AVAILABLE = False
+
+# flat     exact brute-force scan; best for a few thousand questions
+# hnsw     graph index, fast + high recall, no training; after an edit, exact flat search
+#          serves while the graph is rebuilt in the background (nothing is re-embedded)
+# ivf_flat inverted lists over full vectors; needs training
+# ivf_sq8  inverted lists over 8-bit scalar-quantized vectors (4x smaller)
+# ivf_pq   inverted lists over product-quantized codes (smallest, lowest recall)
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_sq8", "ivf_pq")
+
+HNSW_M = int(os.getenv("HNSW_M", 32))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", 80))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", 64))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", 16))
+
+
+def choose_index_type(n_vectors, configured=None):
+    """
+    VECTOR_INDEX_TYPE picks the type explicitly; "auto" (default) goes by catalog size:
+    exact search while it is cheap, HNSW for mid-size catalogs, IVF-SQ8 beyond that.
+    """
+    configured = (configured or os.getenv("VECTOR_INDEX_TYPE", "auto")).lower()
+    if configured in INDEX_TYPES:
+        kind = configured
+    elif n_vectors < 20000:
+        kind = "flat"
+    elif n_vectors < 500000:
+        kind = "hnsw"
+    else:
+        kind = "ivf_sq8"
+    if n_vectors < min_train_points(kind):
+        # too few vectors to train the coarse quantizer / codebooks
+        kind = "flat"
+    return kind
+
+
+def _nlist(n_vectors):
+    # ~4*sqrt(n) lists, but keep >= 39 training points per list
+    return max(1, min(65536, int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def min_train_points(kind):
+    if kind == "ivf_pq":
+        return 256 * 39  # 8-bit PQ codebooks need ~39 points per centroid
+    if kind.startswith("ivf"):
+        return 16 * 39
+    return 0
+
+
+def _pq_m(dim):
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if dim % m == 0 and dim // m >= 4:
+            return m
+    return 1
+
+
+def factory_string(kind, dim, n_vectors):
+    if kind == "flat":
+        return "IDMap2,Flat"
+    if kind == "hnsw":
+        return f"IDMap2,HNSW{HNSW_M}"
+    nlist = _nlist(n_vectors)
+    if kind == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if kind == "ivf_sq8":
+        return f"IVF{nlist},SQ8"
+    if kind == "ivf_pq":
+        return f"IVF{nlist},PQ{_pq_m(dim)}"
+    raise ValueError(f"unknown index type: {kind}")
+
+
+def tune(index):
+    """Apply search-time parameters (not all of them survive write_index/read_index)"""
+    ps = faiss.ParameterSpace()
+    kind = index_kind(index)
+    if kind.startswith("ivf"):
+        ps.set_index_parameter(index, "nprobe", IVF_NPROBE)
+    elif kind == "hnsw":
+        ps.set_index_parameter(index, "efSearch", HNSW_EF_SEARCH)
+    return index
+
+
+def build_index(vectors, ids, kind=None):
+    """Create, train and fill an inner-product index addressed by `ids` (int64)"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ids = np.asarray(ids, dtype=np.int64)
+    kind = kind or choose_index_type(len(vectors))
+    if len(vectors) < min_train_points(kind):
+        raise ValueError(f"{kind} needs at least {min_train_points(kind)} vectors to train, got {len(vectors)}")
+    dim = vectors.shape[1]
+    index = faiss.index_factory(dim, factory_string(kind, dim, len(vectors)), faiss.METRIC_INNER_PRODUCT)
+    if kind == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        index.train(vectors)
+    if len(vectors):
+        index.add_with_ids(vectors, ids)
+    return tune(index)
+
+
+def index_kind(index):
+    if faiss.try_extract_index_ivf(index) is not None:
+        ivf = faiss.downcast_index(faiss.extract_index_ivf(index))
+        if isinstance(ivf, faiss.IndexIVFPQ):
+            return "ivf_pq"
+        if isinstance(ivf, faiss.IndexIVFScalarQuantizer):
+            return "ivf_sq8"
+        return "ivf_flat"
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def supports_remove(index):
+    # HNSW graphs cannot drop nodes; they are rebuilt from the stored vectors instead
+    # (on a background thread, see VectorStore.apply)
+    return index_kind(index) != "hnsw"
+
+
+def index_bytes(index):
+    return int(faiss.serialize_index(index).nbytes)
@@ -0,0 +1,196 @@
+# index_jobs.py (background AI index builds with progress tracking)
+import os
+import time
+import uuid
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from pymongo import DESCENDING
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+
+class BuildJob:
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:12]
+        self.status = "queued"  # queued -> running -> done | failed
+        self.created = datetime.utcnow()
+        self.started = None
+        self.finished = None
+        self.stage = None
+        self.total = 0  # documents in the catalog
+        self.to_encode = 0  # documents not found in the embedding cache
+        self.encoded = 0
+        self.result = None
+        self.error = None
+        self._encode_t0 = None
+
+    def progress(self, stage=None, total=None, to_encode=None, encoded=None):
+        """Callback handed to the build function"""
+        if stage is not None:
+            self.stage = stage
+        if total is not None:
+            self.total = total
+        if to_encode is not None:
+            self.to_encode = to_encode
+            if self._encode_t0 is None:
+                self._encode_t0 = time.monotonic()
+        if encoded is not None:
+            self.encoded = encoded
+
+    def eta_seconds(self):
+        if self.status != "running" or not self.encoded or not self.to_encode:
+            return None
+        elapsed = time.monotonic() - self._encode_t0
+        return round(elapsed / self.encoded * (self.to_encode - self.encoded), 1)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "documents": self.total,
+            "to_encode": self.to_encode,
+            "encoded": self.encoded,
+            "eta_seconds": self.eta_seconds(),
+            "created": self.created.isoformat(),
+            "started": self.started.isoformat() if self.started else None,
+            "finished": self.finished.isoformat() if self.finished else None,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class BuildAlreadyRunning(Exception):
+    def __init__(self, job):
+        super().__init__(f"index build {job.get('job_id')} is already running")
+        self.job = job  # status dict of the running build
+
+
+class IndexBuildJobs:
+    """
+    Runs `build_fn(progress=job.progress)` on a background thread. Only one build runs at
+    a time across all workers: it holds the "index_build" lease in `meta_col` (renewed
+    while it runs, like the rollup lease), and every job's state is saved there every
+    `save_interval` seconds, so any worker can answer status requests.
+    """
+
+    def __init__(self, build_fn, meta_col, keep=20, lease_seconds=60, save_interval=1.0):
+        self.build_fn = build_fn
+        self.meta_col = meta_col
+        self.keep = keep
+        self.lease_seconds = lease_seconds
+        self.save_interval = save_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._active = None  # the BuildJob running in this process
+        self._lock = threading.Lock()
+
+    def _lease(self, job):
+        now = datetime.utcnow()
+        try:
+            self.meta_col.find_one_and_update(
+                {"_id": "index_build", "lease_until": {"$lt": now}},
+                {"$set": {"lease_until": now + timedelta(seconds=self.lease_seconds), "owner": self.owner, "job_id": job.id}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # the doc exists and another build holds the lease
+            return False
+        return True
+
+    def _renew(self, job):
+        self.meta_col.update_one(
+            {"_id": "index_build", "job_id": job.id},
+            {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}},
+        )
+
+    def _release(self, job):
+        self.meta_col.update_one({"_id": "index_build", "job_id": job.id}, {"$set": {"lease_until": datetime.utcnow()}})
+
+    def _save(self, job):
+        self.meta_col.replace_one(
+            {"_id": f"index_job:{job.id}"},
+            {"kind": "index_job", "owner": self.owner, **job.to_dict()},
+            upsert=True,
+        )
+
+    def _trim(self):
+        old = self.meta_col.find({"kind": "index_job"}, {"_id": 1}).sort("created", DESCENDING).skip(self.keep)
+        ids = [d["_id"] for d in old]
+        if ids:
+            self.meta_col.delete_many({"_id": {"$in": ids}})
+
+    def start(self):
+        with self._lock:
+            job = BuildJob()
+            if self._active is not None or not self._lease(job):
+                raise BuildAlreadyRunning(self.active() or {"job_id": None, "status": "running"})
+            self._active = job
+            self._save(job)
+            self._trim()
+        threading.Thread(target=self._run, args=(job,), name=f"index-build-{job.id}", daemon=True).start()
+        return job
+
+    def _heartbeat(self, job, done):
+        while not done.wait(self.save_interval):
+            try:
+                self._renew(job)
+                self._save(job)
+            except PyMongoError:
+                traceback.print_exc()
+
+    def _run(self, job):
+        job.status = "running"
+        job.started = datetime.utcnow()
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, done), name=f"index-build-{job.id}-lease", daemon=True)
+        heartbeat.start()
+        try:
+            job.result = self.build_fn(progress=job.progress)
+            job.status = "done"
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished = datetime.utcnow()
+            done.set()
+            # so a last heartbeat cannot overwrite the final state
+            heartbeat.join()
+            try:
+                self._save(job)
+                self._release(job)
+            except PyMongoError:
+                # the lease runs out by itself; the job then reads as failed (see _view)
+                traceback.print_exc()
+            with self._lock:
+                self._active = None
+
+    def _view(self, doc):
+        """Stored job state; a build whose worker stopped renewing the lease reads as failed"""
+        job = {k: v for k, v in doc.items() if k not in ("_id", "kind", "owner")}
+        if job["status"] in ("queued", "running"):
+            lease = self.meta_col.find_one({"_id": "index_build"}) or {}
+            if lease.get("job_id") != job["job_id"] or lease.get("lease_until", datetime.min) < datetime.utcnow():
+                job.update(status="failed", eta_seconds=None, error="build stopped: its worker exited")
+        return job
+
+    def get(self, job_id):
+        """Status dict of `job_id` (built by any worker), or None"""
+        active = self._active
+        if active is not None and active.id == job_id:
+            return active.to_dict()
+        doc = self.meta_col.find_one({"_id": f"index_job:{job_id}"})
+        return self._view(doc) if doc else None
+
+    def active(self):
+        lease = self.meta_col.find_one({"_id": "index_build"})
+        if not lease or lease.get("lease_until", datetime.min) < datetime.utcnow():
+            return None
+        return self.get(lease["job_id"])
+
+    def recent(self):
+        active = self._active
+        docs = self.meta_col.find({"kind": "index_job"}).sort("created", DESCENDING).limit(self.keep)
+        return [active.to_dict() if active is not None and d["job_id"] == active.id else self._view(d) for d in docs]
@@ -0,0 +1,31 @@
+# language.py (script detection for query routing + single-language catalog projection)
+import re
+
+LANGUAGES = ("en", "si", "ta")
+
+_SINHALA = re.compile(r"[\u0D80-\u0DFF]")
+_TAMIL = re.compile(r"[\u0B80-\u0BFF]")
+
+
+def detect_language(text, default="en"):
+    """'si' or 'ta' when the text is mostly Sinhala / Tamil script, else `default`"""
+    si = len(_SINHALA.findall(text or ""))
+    ta = len(_TAMIL.findall(text or ""))
+    if not si and not ta:
+        return default
+    return "si" if si >= ta else "ta"
+
+
+def localize(obj, lang):
+    """
+    Copy of a catalog document where every {en, si, ta} text field keeps only `lang`
+    (falling back to English), e.g. {"en": "Passport", "si": ...} -> {"si": "..."}.
+    The shape stays the same, so clients keep reading name[lang].
+    """
+    if isinstance(obj, list):
+        return [localize(v, lang) for v in obj]
+    if not isinstance(obj, dict):
+        return obj
+    if obj and set(obj) <= set(LANGUAGES):
+        return {lang: obj.get(lang) or obj.get("en")}
+    return {k: localize(v, lang) for k, v in obj.items()}
@@ -0,0 +1,128 @@
+# lexical_index.py (in-memory BM25 over the AI search documents + per-path latency)
+import re
+import math
+import time
+import threading
+from collections import deque
+
+import numpy as np
+
+# split on whitespace/punctuation only: \w would break Sinhala/Tamil words at vowel signs
+TOKEN_RE = re.compile(r"[^\s|.,;:!?()\[\]{}<>\"'`/\\+=*&^%$#@~-]+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or "").casefold())
+
+
+class BM25Index:
+    """
+    Inverted index over (vid, text) pairs. Postings are numpy arrays of document
+    positions + term frequencies, so a query only touches the documents it matches.
+    """
+
+    def __init__(self, docs, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.vids = []
+        lengths = []
+        postings = {}  # term -> {position: tf}
+        for pos, (vid, text) in enumerate(docs):
+            tokens = tokenize(text)
+            self.vids.append(vid)
+            lengths.append(len(tokens))
+            for t in tokens:
+                tf = postings.setdefault(t, {})
+                tf[pos] = tf.get(pos, 0) + 1
+        self.vids = np.array(self.vids, dtype=np.int64)
+        self.lengths = np.array(lengths, dtype=np.float32)
+        self.avgdl = float(self.lengths.mean()) if len(lengths) else 0.0
+        n = len(lengths)
+        self.postings = {}
+        for t, tf in postings.items():
+            idf = math.log(1 + (n - len(tf) + 0.5) / (len(tf) + 0.5))
+            self.postings[t] = (
+                np.fromiter(tf.keys(), dtype=np.int64, count=len(tf)),
+                np.fromiter(tf.values(), dtype=np.float32, count=len(tf)),
+                idf,
+            )
+
+    def __len__(self):
+        return len(self.vids)
+
+    def search(self, query, top_k=5):
+        """Return (terms, [(vid, score, matched_terms), ...]) best first"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not len(self.vids):
+            return terms, []
+        scores = np.zeros(len(self.vids), dtype=np.float32)
+        matched = np.zeros(len(self.vids), dtype=np.int16)
+        norm = self.k1 * (1 - self.b + self.b * self.lengths / (self.avgdl or 1.0))
+        for t in terms:
+            posting = self.postings.get(t)
+            if posting is None:
+                continue
+            pos, tf, idf = posting
+            scores[pos] += idf * tf * (self.k1 + 1) / (tf + norm[pos])
+            matched[pos] += 1
+        hit = np.flatnonzero(matched)
+        if not len(hit):
+            return terms, []
+        k = min(top_k, len(hit))
+        best = hit[np.argpartition(-scores[hit], k - 1)[:k]]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return terms, [(int(self.vids[i]), float(scores[i]), int(matched[i])) for i in best]
+
+
+def confident(terms, hits, min_score, margin, max_terms):
+    """
+    A short query whose best lexical hit contains every query term, scores at least
+    `min_score` and beats the runner-up by `margin`x is answered without the model.
+    """
+    if not hits or len(terms) > max_terms:
+        return False
+    _, top, matched = hits[0]
+    if matched < len(terms) or top < min_score:
+        return False
+    return len(hits) == 1 or top >= margin * hits[1][1]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """rankings: lists of keys, best first; returns keys ordered by sum(1 / (k + rank))"""
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class PathLatency:
+    """Per retrieval path latency (last `window` requests) for /api/admin/ai_metrics"""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._samples = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, path, seconds):
+        with self._lock:
+            self._samples.setdefault(path, deque(maxlen=self.window)).append(seconds * 1000.0)
+            self._counts[path] = self._counts.get(path, 0) + 1
+
+    def timer(self):
+        t0 = time.perf_counter()
+        return lambda path: self.record(path, time.perf_counter() - t0)
+
+    def stats(self):
+        with self._lock:
+            out = {}
+            for path, samples in self._samples.items():
+                ms = np.fromiter(samples, dtype=np.float64, count=len(samples))
+                out[path] = {
+                    "requests": self._counts[path],
+                    "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                    "p95_ms": round(float(np.percentile(ms, 95)), 3),
+                    "max_ms": round(float(ms.max()), 3),
+                }
+            return out
@@ -0,0 +1,105 @@
+# query_encoder.py (micro-batching encoder for concurrent AI search queries)
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class QueueFullError(Exception):
+    """Raised when more queries are waiting than the encoder queue allows"""
+
+
+class BatchingEncoder:
+    """
+    Collects queries that arrive within `batch_window_ms` of each other (up to
+    `max_batch_size`) and runs them through `encode_fn` in one forward pass.
+    Each caller gets back its own row. The worker thread starts on first use,
+    so it is created inside each server process rather than before a fork.
+    """
+
+    def __init__(self, encode_fn, max_batch_size=32, batch_window_ms=5, max_queue=1024):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.batch_window = max(0.0, float(batch_window_ms)) / 1000.0
+        self.max_queue = int(max_queue)
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # metrics
+        self.queries = 0
+        self.batches = 0
+        self.rejected = 0
+        self.errors = 0
+        self.largest_batch = 0
+        self.encode_seconds = 0.0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="query-encoder", daemon=True)
+                self._thread.start()
+
+    def submit(self, text):
+        self._ensure_started()
+        fut = Future()
+        try:
+            self._queue.put_nowait((text, fut))
+        except queue.Full:
+            self.rejected += 1
+            raise QueueFullError("query encoder queue is full")
+        return fut
+
+    def encode(self, text, timeout=30):
+        """Encode one query; returns a 1-D vector"""
+        return self.submit(text).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # identical queries in one window are encoded once
+            unique = list(dict.fromkeys(text for text, _ in batch))
+            started = time.perf_counter()
+            try:
+                vectors = self.encode_fn(unique)
+                rows = {text: vectors[i] for i, text in enumerate(unique)}
+                for text, fut in batch:
+                    fut.set_result(rows[text])
+            except Exception as e:
+                self.errors += 1
+                for _, fut in batch:
+                    fut.set_exception(e)
+            self.encode_seconds += time.perf_counter() - started
+            self.queries += len(batch)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+    def stats(self):
+        return {
+            "batch_window_ms": self.batch_window * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "max_queue": self.max_queue,
+            "queue_depth": self._queue.qsize(),
+            "queries": self.queries,
+            "batches": self.batches,
+            "avg_batch_size": round(self.queries / self.batches, 2) if self.batches else 0,
+            "largest_batch": self.largest_batch,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "avg_encode_ms": round(self.encode_seconds * 1000.0 / self.batches, 2) if self.batches else 0,
+        }
@@ -16,26 +16,50 @@ class RecommendationEngine:
         self.eng_col = self.db["engagements"]
         self.ads_col = self.db["ads"]
 
+    # the user fields segment_user() reads; project to these when segmenting in bulk
+    SEGMENT_FIELDS = {
+        "extended_profile.family": 1,
+        "extended_profile.education.highest_qualification": 1,
+        "extended_profile.career.current_job": 1,
+        "profile.basic.age": 1,
+    }
+
     def get_user_segment(self, user_id):
         """Segment users based on demographics and behavior"""
         if not user_id:
             return "unknown"
         try:
-            user = self.users_col.find_one({"_id": ObjectId(user_id)})
+            user = self.users_col.find_one({"_id": ObjectId(user_id)}, self.SEGMENT_FIELDS)
         except:
              return "unknown"
             
         if not user:
             return "unknown"
-        
-        profile = user.get('extended_profile', {})
-        engagements = list(self.eng_col.find({"user_id": user_id}).sort("timestamp", -1).limit(50))
+        return self.segment_user(user)
+
+    def segment_users(self, users):
+        """Segment counts {segment: users} for already loaded user documents (or a cursor), in one pass"""
+        counts = {}
+        for user in users:
+            for segment in self.segment_user(user):
+                counts[segment] = counts.get(segment, 0) + 1
+        return counts
+
+    @staticmethod
+    def segment_user(user):
+        """Segments of one user document; no database access"""
+        profile = user.get('extended_profile') or {}
+        family = profile.get('family') or {}
         
         # Demographic segmentation
-        age = profile.get('family', {}).get('age') or user.get('profile', {}).get('basic', {}).get('age')
-        education = profile.get('education', {}).get('highest_qualification', 'unknown')
-        children = profile.get('family', {}).get('children', [])
-        job = profile.get('career', {}).get('current_job', 'unknown')
+        age = family.get('age') or (user.get('profile') or {}).get('basic', {}).get('age')
+        education = (profile.get('education') or {}).get('highest_qualification', 'unknown')
+        children = family.get('children', [])
+        job = (profile.get('career') or {}).get('current_job') or 'unknown'
+        try:
+            age = int(age) if age else None
+        except (TypeError, ValueError):
+            age = None
         
         segment = []
         
@@ -63,7 +87,7 @@ class RecommendationEngine:
         # Family-based segments
         if children:
             segment.append("parent")
-            children_ages = profile.get('family', {}).get('children_ages', [])
+            children_ages = family.get('children_ages', [])
             if any(age in [5, 6, 7, 8, 9, 10] for age in children_ages):
                 segment.append("primary_school_parent")
             if any(age in [11, 12, 13, 14, 15, 16] for age in children_ages):
@@ -72,7 +96,7 @@ class RecommendationEngine:
                 segment.append("university_age_parent")
                 
         # Career-based segments
-        job_lower = job.lower()
+        job_lower = str(job).lower()
         if 'government' in job_lower:
             segment.append("government_employee")
         if any(word in job_lower for word in ['manager', 'director', 'head']):
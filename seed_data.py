@@ -3,6 +3,7 @@ from pymongo import MongoClient
 import os
 from dotenv import load_dotenv
 from datetime import datetime
+from db_indexes import ensure_indexes
 
 load_dotenv()
 
@@ -23,6 +24,7 @@ categories_col.delete_many({})
 officers_col.delete_many({})
 ads_col.delete_many({})
 products_col.delete_many({})
+ensure_indexes(db)
 
 # Seed categories
 categories = [
@@ -553,81 +555,23 @@ docs = [
 services_col.insert_many(docs)
 print(f"✅ Seeded {services_col.count_documents({})} ministries with services successfully!")
 
+# materialize the homepage category view, then bump the catalog version so running
+# servers drop cached /api/services etc. (and old ETags)
+from category_view import CategoryView
+CategoryView(services_col, categories_col, db["category_view"]).rebuild()
+db["meta"].update_one({"_id": "catalog"}, {"$inc": {"version": 1}}, upsert=True)
+
 # Build FAISS index automatically
 print("\n🔄 Building AI vector index...")
 try:
-    import numpy as np
-    from sentence_transformers import SentenceTransformer
-    import json
-    import pathlib
-    
-    # Try to import faiss
-    try:
-        import faiss
-        FAISS_AVAILABLE = True
-    except Exception:
-        FAISS_AVAILABLE = False
-    
-    INDEX_PATH = pathlib.Path("./data/faiss.index")
-    META_PATH = pathlib.Path("./data/faiss_meta.json")
-    
-    # Create data directory
-    os.makedirs("data", exist_ok=True)
-    
-    # Load embedding model
+    # same build path as /api/admin/build_index; unchanged questions come from the embedding cache
     print("   Loading embedding model...")
-    model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    
-    # Build documents for indexing
-    docs_to_index = []
-    for svc in services_col.find():
-        svc_id = svc.get("id")
-        svc_name = svc.get("name", {}).get("en") or str(svc.get("name"))
-        for sub in svc.get("subservices", []):
-            sub_id = sub.get("id")
-            sub_name = sub.get("name", {}).get("en") or str(sub.get("name"))
-            for q in sub.get("questions", []):
-                q_text = q.get("q", {}).get("en") or str(q.get("q"))
-                a_text = q.get("answer", {}).get("en") or str(q.get("answer"))
-                content = " | ".join([svc_name or "", sub_name or "", q_text or "", a_text or ""])
-                docs_to_index.append({
-                    "doc_id": f"{svc_id}::{sub_id}::{q_text[:80]}",
-                    "service_id": svc_id,
-                    "subservice_id": sub_id,
-                    "title": q_text,
-                    "content": content,
-                    "metadata": {
-                        "downloads": q.get("downloads", []),
-                        "location": q.get("location"),
-                        "instructions": q.get("instructions")
-                    }
-                })
+    from app import build_vector_index
     
-    # Create embeddings
-    print(f"   Creating embeddings for {len(docs_to_index)} documents...")
-    texts = [d["content"] for d in docs_to_index]
-    if texts:
-        embeddings = model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
-        # Normalize for cosine similarity
-        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-        norms[norms == 0] = 1.0
-        embeddings = embeddings / norms
-        
-        if FAISS_AVAILABLE:
-            dim = embeddings.shape[1]
-            index = faiss.IndexFlatIP(dim)
-            index.add(embeddings.astype(np.float32))
-            faiss.write_index(index, str(INDEX_PATH))
-            print(f"   ✅ FAISS index saved to {INDEX_PATH}")
-        else:
-            np.save("data/embeddings.npy", embeddings)
-            print("   ✅ Embeddings saved (FAISS not available, using fallback)")
-        
-        # Save metadata
-        with open(META_PATH, "w", encoding="utf-8") as f:
-            json.dump(docs_to_index, f, ensure_ascii=False, indent=2)
-        print(f"   ✅ Metadata saved to {META_PATH}")
-        print(f"\n🎉 AI index built successfully with {len(docs_to_index)} documents!")
+    result = build_vector_index()
+    if result.get("count"):
+        print(f"   ✅ Indexed {result['count']} documents ({result.get('encoded', 0)} newly encoded, {result.get('cached', 0)} from cache)")
+        print(f"\n🎉 AI index built successfully with {result['count']} documents!")
     else:
         print("   ⚠️ No documents to index")
 except Exception as e:
@@ -0,0 +1,139 @@
+# sketches.py (mergeable streaming sketches: HyperLogLog, Count-Min, top-k)
+#
+# Error bounds (defaults used by engagement_sketches.py):
+#   HyperLogLog, p=14 (16384 registers, 16 KB): relative standard error 1.04/sqrt(2^p) ~ 0.81%
+#     (~95% of estimates within 1.6%). Merging two sketches (register-wise max) gives exactly
+#     the sketch of the union, so the bound holds for any number of merged days.
+#   Count-Min, width w=2048, depth d=5: never underestimates; with probability 1 - e^-d
+#     (~99.3%) the overestimate is at most e/w * N (~0.13% of N), N = events added across all
+#     merged sketches. Merging is element-wise addition.
+#   Top-k: each sketch keeps the k keys with the highest Count-Min estimate seen so far; a key
+#     whose frequency stays above ~N/k is retained. Merged lists are re-ranked with the
+#     merged Count-Min, so a key that is frequent only in aggregate (never in any single
+#     sketch's top k) can be missed.
+import zlib
+import hashlib
+
+import numpy as np
+
+
+def _hash64(value):
+    digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class HyperLogLog:
+    def __init__(self, p=14, registers=None):
+        if not 4 <= p <= 18:
+            raise ValueError("p must be between 4 and 18")
+        self.p = p
+        self.m = 1 << p
+        self.registers = registers if registers is not None else np.zeros(self.m, dtype=np.uint8)
+
+    def add(self, value):
+        h = _hash64(value)
+        idx = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        # rank = position of the leftmost 1-bit in the remaining 64-p bits
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("cannot merge HyperLogLogs with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        m = self.m
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / float(np.sum(np.power(2.0, -self.registers.astype(np.float64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # small range: linear counting is more accurate
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+    def standard_error(self):
+        return 1.04 / np.sqrt(self.m)
+
+    def to_bytes(self):
+        return zlib.compress(self.registers.tobytes())
+
+    @classmethod
+    def from_bytes(cls, p, data):
+        return cls(p, np.frombuffer(zlib.decompress(data), dtype=np.uint8).copy())
+
+
+class CountMinSketch:
+    def __init__(self, width=2048, depth=5, table=None):
+        self.width = width
+        self.depth = depth
+        self.table = table if table is not None else np.zeros((depth, width), dtype=np.uint32)
+        self.total = int(self.table[0].sum()) if table is not None else 0
+
+    def _cells(self, key):
+        # double hashing: d indexes from one 128-bit digest
+        digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, key, n=1):
+        cells = self._cells(key)
+        self.table[np.arange(self.depth), cells] += n
+        self.total += n
+        return int(self.table[np.arange(self.depth), cells].min())
+
+    def estimate(self, key):
+        return int(self.table[np.arange(self.depth), self._cells(key)].min())
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("cannot merge Count-Min sketches of different shape")
+        self.table += other.table
+        self.total += other.total
+        return self
+
+    def error_bound(self):
+        """(max overestimate, probability it holds) for the events added so far"""
+        return float(np.e / self.width * self.total), float(1 - np.exp(-self.depth))
+
+    def to_bytes(self):
+        return zlib.compress(self.table.tobytes())
+
+    @classmethod
+    def from_bytes(cls, width, depth, data):
+        table = np.frombuffer(zlib.decompress(data), dtype=np.uint32).reshape(depth, width).copy()
+        return cls(width, depth, table)
+
+
+class TopK:
+    """Heavy hitters: a Count-Min sketch plus the k keys with the highest estimates"""
+
+    def __init__(self, k=64, width=2048, depth=5, cms=None, keys=()):
+        self.k = k
+        self.cms = cms if cms is not None else CountMinSketch(width, depth)
+        self.candidates = {key: self.cms.estimate(key) for key in keys}
+
+    def add(self, key, n=1):
+        estimate = self.cms.add(key, n)
+        if key in self.candidates or len(self.candidates) < self.k:
+            self.candidates[key] = estimate
+            return
+        # k is small, so a linear scan for the minimum is cheaper than keeping a heap in sync
+        weakest = min(self.candidates, key=self.candidates.get)
+        if estimate > self.candidates[weakest]:
+            del self.candidates[weakest]
+            self.candidates[key] = estimate
+
+    def merge(self, other):
+        self.cms.merge(other.cms)
+        keys = set(self.candidates) | set(other.candidates)
+        ranked = sorted(((key, self.cms.estimate(key)) for key in keys), key=lambda kv: (-kv[1], str(kv[0])))
+        self.candidates = dict(ranked[:self.k])
+        return self
+
+    def top(self, limit=10):
+        return sorted(self.candidates.items(), key=lambda kv: (-kv[1], str(kv[0])))[:limit]
@@ -31,7 +31,7 @@ document.querySelectorAll('.tab-btn').forEach(btn => {
     });
 });
 
-// Rebuild AI Index
+// Rebuild AI Index (runs as a background job; poll until it finishes)
 async function rebuildIndex() {
     const btn = document.getElementById('rebuildIndexBtn');
     btn.disabled = true;
@@ -39,8 +39,27 @@ async function rebuildIndex() {
 
     try {
         const res = await fetch('/api/admin/build_index', { method: 'POST' });
-        const data = await res.json();
-        alert(`AI Index rebuilt successfully!\n\nIndexed: ${data.count} documents\nFAISS Available: ${data.faiss ? 'Yes' : 'No (using fallback)'}`);
+        let job = await res.json();
+        if (res.status === 409) {
+            btn.textContent = '🔄 Build already running...';
+        }
+        while (job.status === 'queued' || job.status === 'running') {
+            await new Promise(r => setTimeout(r, 1000));
+            const r = await fetch(`/api/admin/build_index/${job.job_id}`);
+            job = await r.json();
+            if (job.to_encode) {
+                const eta = job.eta_seconds != null ? `, ~${Math.ceil(job.eta_seconds)}s left` : '';
+                btn.textContent = `🔄 Encoding ${job.encoded}/${job.to_encode}${eta}`;
+            } else if (job.stage) {
+                btn.textContent = `🔄 ${job.stage}...`;
+            }
+        }
+        if (job.status === 'done') {
+            const data = job.result || {};
+            alert(`AI Index rebuilt successfully!\n\nIndexed: ${data.count} documents\nFAISS Available: ${data.faiss ? 'Yes' : 'No (using fallback)'}`);
+        } else {
+            alert('Error rebuilding index: ' + (job.error || 'unknown error'));
+        }
     } catch (err) {
         alert('Error rebuilding index: ' + err.message);
     }
@@ -28,7 +28,7 @@ async function loadCategories() {
     try {
         // Fetch if empty
         if (categories.length === 0) {
-            const res = await fetch("/api/categories");
+            const res = await fetch(`/api/categories?lang=${lang}`);
             categories = await res.json();
         }
 
@@ -69,30 +69,23 @@ async function loadMinistriesInCategory(cat) {
     document.getElementById("sub-title").innerText = cat.name?.[lang] || cat.name?.en || cat.id;
     document.getElementById("question-list").innerHTML = "";
 
-    // If categories document contains ministry_ids show them
-    if (cat.ministry_ids && cat.ministry_ids.length) {
-        for (let id of cat.ministry_ids) {
-            try {
-                const r = await fetch(`/api/service/${id}`);
-                const s = await r.json();
-                if (s && s.subservices) {
-                    s.subservices.forEach(sub => {
-                        let li = document.createElement("li");
-                        li.className = "service-item"; // consistently use service-item
-                        li.textContent = sub.name?.[lang] || sub.name?.en || sub.id;
-                        li.onclick = () => loadQuestions(s, sub);
-                        list.appendChild(li);
-                    });
-                }
-            } catch (err) {
-                console.error("Error loading service:", id, err);
-            }
-        }
+    // /api/categories embeds each category's ministries and subservice names;
+    // the full service (questions) is only fetched when a subservice is opened
+    if (cat.ministries && cat.ministries.length) {
+        cat.ministries.forEach(m => {
+            (m.subservices || []).forEach(sub => {
+                let li = document.createElement("li");
+                li.className = "service-item"; // consistently use service-item
+                li.textContent = sub.name?.[lang] || sub.name?.en || sub.id;
+                li.onclick = () => openSubservice(m.id, sub.id);
+                list.appendChild(li);
+            });
+        });
     } else {
         // Fallback: query services and filter by category
         try {
             if (services.length === 0) {
-                const svcRes = await fetch("/api/services");
+                const svcRes = await fetch(`/api/services?lang=${lang}`);
                 services = await svcRes.json();
             }
             services.filter(s => s.category === cat.id).forEach(s => {
@@ -110,11 +103,22 @@ async function loadMinistriesInCategory(cat) {
     }
 }
 
+async function openSubservice(serviceId, subId) {
+    try {
+        const r = await fetch(`/api/service/${encodeURIComponent(serviceId)}?lang=${lang}`);
+        const s = await r.json();
+        const sub = (s.subservices || []).find(x => x.id === subId);
+        if (sub) loadQuestions(s, sub);
+    } catch (err) {
+        console.error("Error loading service:", serviceId, err);
+    }
+}
+
 // Fallback: Load services directly (ministries list)
 // Fallback: Load services directly (ministries list)
 async function loadServices() {
     try {
-        const res = await fetch("/api/services");
+        const res = await fetch(`/api/services?lang=${lang}`);
         services = await res.json();
         const list = document.getElementById("main-list");
         if (!list) return;
@@ -134,6 +138,9 @@ async function loadServices() {
 
 function setLang(l) {
     lang = l;
+    // catalog responses are fetched per language
+    categories = [];
+    services = [];
     document.querySelectorAll('.lang-btn').forEach(btn => {
         btn.classList.remove('active');
         if (btn.getAttribute('data-lang') === l) {
@@ -196,20 +203,55 @@ function showAnswer(service, sub, q) {
     document.getElementById("answer-box").innerHTML = html;
 
     // Log engagement non-blocking (without prompts)
-    fetch("/api/engagement", {
+    trackEngagement({
+        user_id: profile_id,
+        age: null,
+        job: null,
+        desires: [],
+        question_clicked: q.q?.[lang] || q.q?.en || q.q,
+        service: currentServiceName
+    });
+}
+
+// Engagement events are buffered and sent together to /api/engagement/batch
+// (every few seconds, at 20 events, or via sendBeacon when the page is hidden)
+const ENGAGEMENT_FLUSH_MS = 5000;
+const ENGAGEMENT_MAX_BUFFER = 20;
+let engagementBuffer = [];
+let engagementTimer = null;
+
+function trackEngagement(event) {
+    engagementBuffer.push(event);
+    if (engagementBuffer.length >= ENGAGEMENT_MAX_BUFFER) {
+        flushEngagements();
+    } else if (!engagementTimer) {
+        engagementTimer = setTimeout(flushEngagements, ENGAGEMENT_FLUSH_MS);
+    }
+}
+
+function flushEngagements(useBeacon = false) {
+    clearTimeout(engagementTimer);
+    engagementTimer = null;
+    if (engagementBuffer.length === 0) return;
+    const body = JSON.stringify(engagementBuffer);
+    engagementBuffer = [];
+    // text/plain keeps sendBeacon a "simple" request (no CORS preflight)
+    if (useBeacon && navigator.sendBeacon && navigator.sendBeacon("/api/engagement/batch", new Blob([body], { type: "text/plain" }))) {
+        return;
+    }
+    fetch("/api/engagement/batch", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-            user_id: profile_id,
-            age: null,
-            job: null,
-            desires: [],
-            question_clicked: q.q?.[lang] || q.q?.en || q.q,
-            service: currentServiceName
-        })
+        body,
+        keepalive: true
     }).catch(err => console.error("Engagement log failed:", err));
 }
 
+document.addEventListener("visibilitychange", () => {
+    if (document.visibilityState === "hidden") flushEngagements(true);
+});
+window.addEventListener("pagehide", () => flushEngagements(true));
+
 // Chat UI
 function openChat() {
     document.getElementById("chat-panel").classList.add("open");
@@ -251,11 +293,7 @@ async function sendChat() {
         }
 
         // Log engagement
-        fetch("/api/engagement", {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ user_id: profile_id, question_clicked: text, service: null })
-        }).catch(() => { });
+        trackEngagement({ user_id: profile_id, question_clicked: text, service: null });
     } catch (err) {
         removeChat(typingId);
         appendChat("bot", "Sorry, there was an error connecting to the AI service.");
@@ -303,14 +341,14 @@ async function autosuggest(q) {
     }
     suggestTimer = setTimeout(async () => {
         try {
-            const res = await fetch(`/api/search/autosuggest?q=${encodeURIComponent(q)}`);
+            const res = await fetch(`/api/search/autosuggest?q=${encodeURIComponent(q)}&lang=${lang}`);
             const items = await res.json();
             const el = document.getElementById("suggestions");
             if (items.length === 0) {
                 el.innerHTML = '<div class="s-item s-empty">No results. Try the AI Assistant!</div>';
             } else {
                 el.innerHTML = items.map(it =>
-                    `<div class="s-item" onclick='pickSuggestion(${JSON.stringify(JSON.stringify(it))})'>${it.name?.en || it.name || it.id}</div>`
+                    `<div class="s-item" onclick='pickSuggestion(${JSON.stringify(JSON.stringify({ id: it.id, sub: it.sub }))})'>${highlightName(it.name, it.hl)}</div>`
                 ).join("");
             }
         } catch (err) {
@@ -319,14 +357,39 @@ async function autosuggest(q) {
     }, 250);
 }
 
-function pickSuggestion(serialized) {
+function escapeHtml(text) {
+    return String(text).replace(/[&<>"']/g, c => ({ "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;" }[c]));
+}
+
+// Wrap the [start, end) ranges the server matched in <b>
+function highlightName(name, hl) {
+    let html = "";
+    let at = 0;
+    (hl || []).forEach(([start, end]) => {
+        if (start < at) return;
+        html += escapeHtml(name.slice(at, start)) + "<b>" + escapeHtml(name.slice(start, end)) + "</b>";
+        at = end;
+    });
+    return html + escapeHtml(name.slice(at));
+}
+
+async function pickSuggestion(serialized) {
     const it = JSON.parse(serialized);
-    // If the suggestion has subservices open first subservice
-    if (it && it.subservices && it.subservices.length) {
-        loadSubservices(it);
-    }
     document.getElementById("suggestions").innerHTML = "";
     document.getElementById("search-input").value = "";
+    // suggestions only carry ids; load the service to open it (and the picked subservice)
+    try {
+        const res = await fetch(`/api/service/${encodeURIComponent(it.id)}?lang=${lang}`);
+        if (!res.ok) return;
+        const service = await res.json();
+        if (service.subservices && service.subservices.length) {
+            loadSubservices(service);
+        }
+        const sub = it.sub && (service.subservices || []).find(s => s.id === it.sub);
+        if (sub) loadQuestions(service, sub);
+    } catch (err) {
+        console.error("Suggestion error:", err);
+    }
 }
 
 // Profile modal flow
@@ -445,14 +508,7 @@ window.onload = async () => {
 
     // Reset view to categories
     await loadCategoriesView();
-
-    // Load services as backup for searching
-    try {
-        const svcRes = await fetch("/api/services");
-        services = await svcRes.json();
-    } catch (err) {
-        console.error("Error loading services:", err);
-    }
+    // the full /api/services list is only fetched by the category fallback, when needed
 
     document.querySelector('.lang-btn[data-lang="en"]')?.classList.add('active');
 };
@@ -0,0 +1,273 @@
+# suggest_index.py (in-memory trilingual prefix index for /api/search/autosuggest)
+import time
+import bisect
+from collections import Counter
+
+from lexical_index import tokenize, TOKEN_RE
+from swr_cache import StaleWhileRevalidate
+
+LANGS = ("en", "si", "ta")
+_END = "\U0010ffff"  # sorts after every token that starts with a given prefix
+MATCH_TYPES = ("exact", "prefix", "word")
+
+
+def _names(field):
+    if isinstance(field, dict):
+        return [(lang, field[lang]) for lang in LANGS if field.get(lang)]
+    return [("en", str(field))] if field else []
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance, or limit + 1 once it is known to exceed `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if prev2 is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class DeletionIndex:
+    """
+    SymSpell-style typo index: every vocabulary term is stored under all strings reachable
+    by deleting up to `max_distance` characters from its first `prefix_length` characters.
+    A lookup only generates the deletes of the query word, so its cost does not grow with
+    the vocabulary.
+    """
+
+    def __init__(self, terms, max_distance=2, prefix_length=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.counts = dict(terms)  # term -> occurrences, used to break ties
+        self.deletes = {}
+        for term in self.counts:
+            for d in self._deletes(term, max_distance):
+                self.deletes.setdefault(d, []).append(term)
+
+    def _deletes(self, word, max_distance):
+        word = word[:self.prefix_length]
+        out = {word}
+        frontier = {word}
+        for _ in range(max_distance):
+            frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))} - out
+            out |= frontier
+        return out
+
+    def lookup(self, word, max_distance=None):
+        """[(term, distance)] within `max_distance` edits, closest then most frequent first"""
+        limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        found = {}
+        for d in self._deletes(word, limit):
+            for term in self.deletes.get(d, ()):
+                if term not in found:
+                    found[term] = edit_distance(word, term, limit)
+        return sorted(((t, dist) for t, dist in found.items() if dist <= limit),
+                      key=lambda x: (x[1], -self.counts[x[0]], x[0]))
+
+
+def typo_budget(word, max_distance=2):
+    # short words ("nic", "119") have too many 1-edit neighbours to correct safely
+    if len(word) <= 3:
+        return 0
+    return min(max_distance, 1 if len(word) <= 5 else 2)
+
+
+class PrefixTable:
+    """
+    Sorted (token, entry) table over service + subservice names in en/si/ta.
+    Each query token is a bisect range lookup, so a keystroke never scans the catalog.
+    Words that match nothing are corrected through a DeletionIndex over the name and
+    question vocabulary (question words point at their subservice).
+    """
+
+    def __init__(self, services, max_distance=2):
+        self.names = {}  # (service id, subservice id or None) -> trilingual name field
+        self.entries = []  # (service_id, subservice_id or None, lang, normalized name)
+        self.max_distance = max_distance
+        pairs = []
+        vocab = Counter()
+        self.term_entries = {}  # vocabulary word -> entry positions, for fuzzy matches
+        for svc in services:
+            sid = svc.get("id")
+            if sid is None:
+                continue
+            named = [(None, svc.get("name"))] + [(sub.get("id"), sub.get("name")) for sub in svc.get("subservices", [])]
+            first_pos = {}
+            for sub_id, field in named:
+                self.names[(sid, sub_id)] = field
+                for lang, name in _names(field):
+                    pos = len(self.entries)
+                    first_pos.setdefault(sub_id, pos)
+                    self.entries.append((sid, sub_id, lang, " ".join(tokenize(name))))
+                    pairs.extend((tok, pos) for tok in set(tokenize(name)))
+                    self._add_terms(vocab, tokenize(name), pos)
+            for sub in svc.get("subservices", []):
+                # question text only feeds the typo vocabulary, linked to the subservice's first name
+                sub_pos = first_pos.get(sub.get("id"))
+                if sub_pos is None:
+                    continue
+                for q in sub.get("questions", []):
+                    for _, text in _names(q.get("q")):
+                        self._add_terms(vocab, tokenize(text), sub_pos)
+        self.fuzzy = DeletionIndex(vocab, max_distance)
+        pairs.sort()
+        self.keys = [tok for tok, _ in pairs]
+        self.ids = [pos for _, pos in pairs]
+        self.built_at = time.time()
+
+    def _add_terms(self, vocab, tokens, pos):
+        vocab.update(tokens)
+        for tok in tokens:
+            self.term_entries.setdefault(tok, set()).add(pos)
+
+    def _prefixed(self, prefix):
+        lo = bisect.bisect_left(self.keys, prefix)
+        hi = bisect.bisect_left(self.keys, prefix + _END, lo)
+        return set(self.ids[lo:hi])
+
+    def match(self, q):
+        """Entries where every query token is a prefix of some word in the name"""
+        tokens = tokenize(q)
+        if not tokens:
+            return [], ""
+        hits = None
+        for tok in sorted(set(tokens), key=len, reverse=True):
+            found = self._prefixed(tok)
+            hits = found if hits is None else hits & found
+            if not hits:
+                return [], ""
+        return hits, " ".join(tokens)
+
+    def rank(self, hits, q_norm):
+        """[(match type, position)]: exact name, then name prefix, then word prefix;
+        services before subservices; shorter names first"""
+        def how(pos):
+            name = self.entries[pos][3]
+            return 0 if name == q_norm else 1 if name.startswith(q_norm) else 2
+        ranked = sorted(hits, key=lambda pos: (how(pos), self.entries[pos][1] is not None, len(self.entries[pos][3])))
+        return [(MATCH_TYPES[how(pos)], pos) for pos in ranked]
+
+    def fuzzy_match(self, q):
+        """
+        Entries matching every query token by prefix, exact vocabulary word or a typo
+        correction; returns [(total edits, position)].
+        """
+        distance = None
+        for tok in set(tokenize(q)):
+            found = dict.fromkeys(self._prefixed(tok) | self.term_entries.get(tok, set()), 0)
+            # known words are taken as typed; only unknown ones are corrected
+            budget = 0 if tok in self.term_entries else typo_budget(tok, self.max_distance)
+            for term, dist in self.fuzzy.lookup(tok, budget) if budget else ():
+                for pos in self.term_entries[term]:
+                    if dist < found.get(pos, dist + 1):
+                        found[pos] = dist
+            if distance is None:
+                distance = found
+            else:
+                distance = {pos: distance[pos] + d for pos, d in found.items() if pos in distance}
+            if not distance:
+                return []
+        return sorted((d, pos) for pos, d in (distance or {}).items())
+
+    def highlights(self, name, tokens):
+        """[start, end) offsets in `name` of the words each query token matched"""
+        spans = []
+        words = [(m.start(), m.end(), m.group().casefold()) for m in TOKEN_RE.finditer(name)]
+        for tok in tokens:
+            for start, end, word in words:
+                if word.startswith(tok):
+                    spans.append([start, min(end, start + len(tok))])
+                    break
+                budget = typo_budget(tok, self.max_distance)
+                if budget and edit_distance(tok, word, budget) <= budget:
+                    spans.append([start, end])
+                    break
+        return sorted(spans)
+
+    def suggest(self, q, limit=10, lang="en"):
+        """
+        Compact typeahead items: {"id", "sub" (subservices only), "name" in `lang`,
+        "match": exact | prefix | word | fuzzy, "hl": [[start, end], ...] into name}
+        """
+        hits, q_norm = self.match(q)
+        ranked = self.rank(hits, q_norm)
+        seen = {(self.entries[pos][0], self.entries[pos][1]) for _, pos in ranked}
+        if len(seen) < limit:
+            # misspelled / romanized words: typo-corrected matches go after exact prefix ones
+            ranked += [("fuzzy", pos) for _, pos in self.fuzzy_match(q)]
+        tokens = list(dict.fromkeys(tokenize(q)))
+        out = []
+        taken = set()
+        for match, pos in ranked:
+            sid, sub_id = self.entries[pos][:2]
+            if (sid, sub_id) in taken:
+                continue
+            taken.add((sid, sub_id))
+            field = self.names[(sid, sub_id)]
+            name = (field.get(lang) or field.get("en") or sid) if isinstance(field, dict) else str(field or sid)
+            item = {"id": sid, "name": name, "match": match, "hl": self.highlights(name, tokens)}
+            if sub_id is not None:
+                item["sub"] = sub_id
+            out.append(item)
+            if len(out) >= limit:
+                break
+        return out
+
+
+class SuggestIndex:
+    """
+    Holds the current PrefixTable. `invalidate()` (called on every admin service write), a
+    change of `version_fn()` (a catalog version shared by all processes, so edits made by
+    other workers are picked up too) and `max_age` make the next lookup rebuild it on a
+    background thread; lookups keep using the previous table until the new one is swapped
+    in. Only the very first lookup waits for a build.
+    """
+
+    def __init__(self, load_fn, max_age=300, max_distance=2, version_fn=None):
+        self.load_fn = load_fn  # () -> iterable of service documents
+        self.max_age = max_age
+        self.max_distance = max_distance
+        self.version_fn = version_fn
+        self._version = None  # version_fn() when the table was last (re)built or invalidated
+        self._cache = StaleWhileRevalidate(
+            lambda: PrefixTable(self.load_fn(), self.max_distance), max_age=max_age, name="suggest-rebuild")
+
+    def invalidate(self):
+        self._cache.invalidate()
+
+    def table(self):
+        if self.version_fn is not None:
+            version = self.version_fn()
+            if version != self._version:
+                if self._version is not None:
+                    self.invalidate()
+                self._version = version
+        return self._cache.get()[0]
+
+    def suggest(self, q, limit=10, lang="en"):
+        return self.table().suggest(q, limit, lang)
+
+    def stats(self):
+        table = self._cache.peek()
+        cache = self._cache.stats()
+        return {
+            "services": len({sid for sid, _ in table.names}) if table else 0,
+            "names": len(table.entries) if table else 0,
+            "tokens": len(table.keys) if table else 0,
+            "vocabulary": len(table.fuzzy.counts) if table else 0,
+            "deletes": len(table.fuzzy.deletes) if table else 0,
+            "built_at": table.built_at if table else None,
+            "catalog_version": self._version,
+            "rebuilding": cache["refreshing"],
+            "last_build_ms": cache["last_duration_ms"],
+            "last_error": cache["last_error"],
+        }
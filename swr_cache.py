@@ -0,0 +1,107 @@
+# swr_cache.py (stale-while-revalidate cache for one expensive payload, e.g. dashboard analytics)
+import time
+import threading
+import traceback
+from datetime import datetime
+
+
+class StaleWhileRevalidate:
+    """
+    Holds the last result of `compute_fn()`. Within `max_age` seconds it is returned as is;
+    after that it is still returned immediately while one background thread recomputes it.
+    Only the very first call (nothing cached yet) and get(force=True) wait for a compute.
+    A failed refresh keeps serving the previous value and is reported in stats().
+    invalidate() makes the cached value stale right away (also if it is being computed).
+    """
+
+    def __init__(self, compute_fn, max_age=60.0, name="swr-refresh"):
+        self.compute_fn = compute_fn
+        self.max_age = float(max_age)
+        self.name = name
+        self._value = None
+        self._computed_at = None  # datetime (utc) of the cached value
+        self._computed_mono = 0.0
+        self._lock = threading.Lock()  # one compute at a time
+        self._flag_lock = threading.Lock()  # guards _refreshing; never held while computing
+        self._refreshing = False
+        self._invalidations = 0
+        self._expired = False
+        # metrics
+        self.hits = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.last_duration = None
+        self.last_error = None
+
+    def _compute(self):
+        with self._lock:
+            started = time.monotonic()
+            seen = self._invalidations
+            try:
+                value = self.compute_fn()
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            self._value = value
+            self._computed_at = datetime.utcnow()
+            self._computed_mono = time.monotonic()
+            # invalidated while computing: the value may already be out of date
+            self._expired = self._invalidations != seen
+            self.last_duration = time.monotonic() - started
+            self.last_error = None
+            self.refreshes += 1
+            return value
+
+    def _refresh_in_background(self):
+        with self._flag_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self._compute()
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name=self.name, daemon=True).start()
+
+    def peek(self):
+        """The cached value (None before the first compute), without refreshing it"""
+        return self._value
+
+    def invalidate(self):
+        self._invalidations += 1
+        self._expired = True
+
+    def get(self, force=False):
+        """(value, computed_at, stale)"""
+        if force or self._computed_at is None:
+            started = self._computed_mono
+            with self._lock:
+                # someone else may have just computed it while we waited for the lock
+                fresh = self._computed_at is not None and self._computed_mono != started
+            if not fresh:
+                self._compute()
+            return self._value, self._computed_at, False
+        if not self._expired and time.monotonic() - self._computed_mono <= self.max_age:
+            self.hits += 1
+            return self._value, self._computed_at, False
+        self.stale_hits += 1
+        self._refresh_in_background()
+        return self._value, self._computed_at, True
+
+    def stats(self):
+        return {
+            "max_age": self.max_age,
+            "computed_at": self._computed_at.isoformat() if self._computed_at else None,
+            "age_seconds": round(time.monotonic() - self._computed_mono, 1) if self._computed_at else None,
+            "refreshing": self._refreshing,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "refreshes": self.refreshes,
+            "last_duration_ms": round(self.last_duration * 1000, 1) if self.last_duration is not None else None,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,515 @@
+# vector_store.py (process-wide holder for the FAISS index + search metadata)
+#
+# On-disk layout (one directory per build, so a build is switched in with a single rename;
+# each search language has its own root: data/index for English, data/index_si, data/index_ta):
+#   data/index/CURRENT              name of the live generation directory
+#   data/index/<gen>/ids.npy        int64 doc_vid()s, sorted; row i of every file below belongs to ids[i]
+#   data/index/<gen>/vectors.npy    fixed-stride float16 (or int8) vectors, memory-mapped
+#   data/index/<gen>/meta.bin       concatenated UTF-8 JSON metadata records
+#   data/index/<gen>/meta.idx.npy   int64 offsets into meta.bin (n + 1 entries)
+#   data/index/<gen>/groups.npy     int64 group_key() of each record's service_id, so the rows
+#                                   of one service are found without decoding the others
+#   data/index/<gen>/faiss.index    ANN index keyed by doc_vid() (when faiss is installed)
+# Everything is opened with mmap, so worker processes share pages through the OS page cache
+# and a search hit only decodes its own metadata record.
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import pathlib
+import threading
+import traceback
+from datetime import datetime
+
+import numpy as np
+
+import index_factory
+from index_factory import FAISS_AVAILABLE
+
+if FAISS_AVAILABLE:
+    import faiss
+
+# float16 halves the size of the vector file; int8 quarters it (vectors are unit length)
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "float16")
+# metadata field whose rows ids_where() finds through groups.npy
+GROUP_FIELD = "service_id"
+
+
+def doc_vid(doc_id):
+    """Stable 63-bit vector id for a doc_id (service::subservice::question)"""
+    digest = hashlib.blake2b(doc_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") & 0x7FFFFFFFFFFFFFFF
+
+
+def group_key(value):
+    """63-bit hash of a GROUP_FIELD value (1 and "1" differ)"""
+    return doc_vid(json.dumps(value))
+
+
+def encode_vectors(vectors, dtype=None):
+    dtype = dtype or VECTOR_STORE_DTYPE
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "int8":
+        return np.clip(np.rint(vectors * 127.0), -127, 127).astype(np.int8)
+    return vectors.astype(np.float16 if dtype == "float16" else np.float32)
+
+
+def decode_vectors(stored):
+    if stored.dtype == np.int8:
+        return stored.astype(np.float32) / 127.0
+    return np.asarray(stored, dtype=np.float32)
+
+
+def _load_npy(path):
+    # empty arrays cannot be memory-mapped
+    try:
+        return np.load(str(path), mmap_mode="r")
+    except ValueError:
+        return np.load(str(path))
+
+
+class MetaStore:
+    """
+    Offset-indexed metadata records sorted by vid. Behaves like a read-only
+    {vid: record} mapping; looking one record up does not parse the others.
+    """
+
+    def __init__(self, ids=None, offsets=None, blob=b"", groups=None):
+        self.ids = ids if ids is not None else np.zeros(0, dtype=np.int64)
+        self.offsets = offsets if offsets is not None else np.zeros(1, dtype=np.int64)
+        self.blob = blob
+        # group_key() per row; None for generations written before groups.npy existed
+        self.groups = groups if groups is not None or len(self.ids) else np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def open(cls, path):
+        path = pathlib.Path(path)
+        ids = _load_npy(path / "ids.npy")
+        offsets = _load_npy(path / "meta.idx.npy")
+        blob = b""
+        if os.path.getsize(path / "meta.bin"):
+            blob = np.memmap(str(path / "meta.bin"), dtype=np.uint8, mode="r")
+        groups = _load_npy(path / "groups.npy") if (path / "groups.npy").exists() else None
+        return cls(ids, offsets, blob, groups)
+
+    @staticmethod
+    def pack(records):
+        """
+        records: iterable of (vid, dict or already-encoded bytes[, group_key]), sorted by vid.
+        The group key is only computed (decoding bytes) when it is not passed along.
+        """
+        ids, offsets, chunks, groups = [], [0], [], []
+        for vid, rec, *group in records:
+            raw = rec if isinstance(rec, bytes) else json.dumps(rec, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            if not group or group[0] is None:
+                group = [group_key((json.loads(raw) if isinstance(rec, bytes) else rec).get(GROUP_FIELD))]
+            ids.append(vid)
+            chunks.append(raw)
+            offsets.append(offsets[-1] + len(raw))
+            groups.append(group[0])
+        return (np.array(ids, dtype=np.int64), np.array(offsets, dtype=np.int64), b"".join(chunks),
+                np.array(groups, dtype=np.int64))
+
+    @classmethod
+    def from_records(cls, records):
+        return cls(*cls.pack(records))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, vid):
+        i = int(np.searchsorted(self.ids, vid))
+        if i < len(self.ids) and int(self.ids[i]) == vid:
+            return i
+        return -1
+
+    def raw(self, i):
+        return bytes(self.blob[int(self.offsets[i]):int(self.offsets[i + 1])])
+
+    def group(self, i):
+        return int(self.groups[i]) if self.groups is not None else None
+
+    def at(self, i):
+        return json.loads(self.raw(i))
+
+    def __contains__(self, vid):
+        return self.position(int(vid)) >= 0
+
+    def __getitem__(self, vid):
+        i = self.position(int(vid))
+        if i < 0:
+            raise KeyError(vid)
+        return self.at(i)
+
+    def get(self, vid, default=None):
+        i = self.position(int(vid))
+        return self.at(i) if i >= 0 else default
+
+    def keys(self):
+        return [int(v) for v in self.ids]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def values(self):
+        return [self.at(i) for i in range(len(self))]
+
+    def items(self):
+        return [(int(self.ids[i]), self.at(i)) for i in range(len(self))]
+
+
+class IndexSnapshot:
+    """Immutable view of one built index. Readers keep a reference for the whole query."""
+
+    def __init__(self, index=None, docs=None, vectors=None, version=0, stamp=None, path=None):
+        self.index = index  # faiss index (see index_factory) keyed by doc_vid()
+        self.docs = docs if docs is not None else MetaStore()  # vid -> metadata record
+        self.vectors = vectors  # stored vectors, row i belongs to docs.ids[i]
+        self.version = version
+        self.stamp = stamp
+        self.path = path
+        self.loaded_at = datetime.utcnow().isoformat()
+
+    def __len__(self):
+        return len(self.docs)
+
+    @property
+    def meta(self):
+        return self.docs.values()
+
+    def ids_where(self, **match):
+        docs = self.docs
+        if GROUP_FIELD in match and docs.groups is not None:
+            # only the rows of that group are decoded (a hash collision is filtered out below)
+            rows = np.flatnonzero(np.asarray(docs.groups) == group_key(match[GROUP_FIELD]))
+            candidates = ((int(docs.ids[i]), docs.at(int(i))) for i in rows)
+        else:
+            candidates = docs.items()
+        return [vid for vid, d in candidates if all(d.get(k) == v for k, v in match.items())]
+
+    def vectors_for(self, vids):
+        rows = [self.docs.position(int(v)) for v in vids]
+        return decode_vectors(self.vectors[rows]) if rows else np.zeros((0, 0), dtype=np.float32)
+
+    def _scan(self, q, top_k, block=65536):
+        # fallback linear scan over the memory-mapped vectors, one block at a time
+        best_s, best_i = [], []
+        for start in range(0, len(self.vectors), block):
+            sims = decode_vectors(self.vectors[start:start + block]) @ q
+            k = min(top_k, len(sims))
+            part = np.argpartition(-sims, k - 1)[:k]
+            best_s.append(sims[part])
+            best_i.append(part + start)
+        sims = np.concatenate(best_s)
+        return np.concatenate(best_i)[np.argsort(-sims)[:top_k]]
+
+    def search(self, q_emb, top_k=5):
+        """q_emb is a (1, dim) normalized query vector; returns metadata rows"""
+        if not len(self.docs):
+            return []
+        if self.index is not None:
+            D, I = self.index.search(q_emb.astype(np.float32), top_k)
+            hits = (self.docs.get(int(vid)) for vid in I[0] if vid >= 0)
+            return [h for h in hits if h is not None]
+        if self.vectors is not None:
+            return [self.docs.at(int(i)) for i in self._scan(q_emb[0].astype(np.float32), top_k)]
+        return []
+
+
+class VectorStore:
+    """
+    Keeps the live index mapped in memory. Only data/index/CURRENT is stat()-ed
+    (at most every `check_interval` seconds) to pick up builds from other processes;
+    builds done through `publish()`/`apply()` swap in directly.
+    """
+
+    def __init__(self, data_dir="data", name="index", check_interval=2.0, legacy=True):
+        self.data_dir = pathlib.Path(data_dir)
+        self.root = self.data_dir / name
+        self.current_path = self.root / "CURRENT"
+        # pre-mmap layout, still read if no generation has been written yet
+        legacy_dir = self.data_dir if legacy else self.root
+        self.legacy_index_path = legacy_dir / "faiss.index"
+        self.legacy_meta_path = legacy_dir / "faiss_meta.json"
+        self.legacy_emb_path = legacy_dir / "embeddings.npy"
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # serializes read-modify-write updates
+        self._snapshot = IndexSnapshot()
+        self._version = 0
+        self._last_check = 0.0
+        # background graph rebuild after apply() (see _schedule_rebuild)
+        self._rebuild_kind = None
+        self._rebuild_requests = 0
+        self._rebuild_thread = None
+        self.rebuild_error = None
+
+    # --- file helpers ---
+    def _file_stamp(self):
+        paths = (self.current_path,)
+        if not self.current_path.exists():
+            paths = (self.legacy_index_path, self.legacy_meta_path, self.legacy_emb_path)
+        stamp = []
+        for p in paths:
+            try:
+                st = os.stat(p)
+                stamp.append((str(p), st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamp.append(None)
+        if paths[0] == self.current_path and stamp[0] is not None:
+            # generation names are tiny; include them so quick successive builds are never missed
+            try:
+                stamp.append(self.current_path.read_text(encoding="utf-8").strip())
+            except OSError:
+                pass
+        return tuple(stamp)
+
+    def _read_generation(self, path):
+        docs = MetaStore.open(path)
+        vectors = _load_npy(path / "vectors.npy")
+        index = None
+        if FAISS_AVAILABLE and (path / "faiss.index").exists():
+            flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+            try:
+                index = faiss.read_index(str(path / "faiss.index"), flags)
+            except RuntimeError:
+                # index type without mmap support
+                index = faiss.read_index(str(path / "faiss.index"))
+            index_factory.tune(index)
+        return index, docs, vectors
+
+    def _read_legacy(self):
+        if not self.legacy_meta_path.exists():
+            return None, MetaStore(), None
+        with open(self.legacy_meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        vids = np.array([doc_vid(d["doc_id"]) for d in meta], dtype=np.int64)
+        order = np.argsort(vids)
+        docs = MetaStore.from_records((int(vids[i]), meta[i]) for i in order)
+        vectors = None
+        if FAISS_AVAILABLE and self.legacy_index_path.exists():
+            legacy = faiss.read_index(str(self.legacy_index_path))
+            # rows follow meta order
+            vectors = legacy.reconstruct_n(0, legacy.ntotal)[order]
+        elif self.legacy_emb_path.exists():
+            vectors = np.load(str(self.legacy_emb_path))[order]
+        index = None
+        if vectors is not None and FAISS_AVAILABLE:
+            index = index_factory.build_index(vectors, docs.ids)
+        return index, docs, vectors
+
+    def _swap(self, index, docs, vectors, stamp, path=None):
+        # caller holds self._lock
+        self._version += 1
+        self._snapshot = IndexSnapshot(index, docs, vectors, self._version, stamp, path)
+        return self._snapshot
+
+    def _write(self, index, records, vectors):
+        """records: (vid, dict|bytes) sorted by vid; vectors: float32 rows in the same order"""
+        gen = datetime.utcnow().strftime("%Y%m%d%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        path = self.root / gen
+        os.makedirs(path, exist_ok=True)
+        ids, offsets, blob, groups = MetaStore.pack(records)
+        np.save(str(path / "ids.npy"), ids)
+        np.save(str(path / "meta.idx.npy"), offsets)
+        np.save(str(path / "groups.npy"), groups)
+        with open(path / "meta.bin", "wb") as f:
+            f.write(blob)
+        np.save(str(path / "vectors.npy"), encode_vectors(vectors) if len(ids) else np.zeros((0, 0), dtype=np.float16))
+        if index is not None:
+            faiss.write_index(index, str(path / "faiss.index"))
+        with self._lock:
+            previous = self._snapshot.path.name if self._snapshot.path else None
+            tmp = str(self.current_path) + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(gen)
+            os.replace(tmp, self.current_path)
+            _, docs, mapped = self._read_generation(path)
+            # keep the in-memory index we just built; the mapped files serve docs + vectors
+            snap = self._swap(index, docs, mapped, self._file_stamp(), path)
+        self._cleanup(keep={gen, previous})
+        return snap
+
+    def _cleanup(self, keep, min_age=60):
+        # the previous generation may still be mapped by other workers (and recent ones
+        # may be mid-write in another process); on Windows removing mapped files just fails
+        now = time.time()
+        for child in self.root.iterdir():
+            if child.is_dir() and child.name not in keep and now - child.stat().st_mtime > min_age:
+                shutil.rmtree(child, ignore_errors=True)
+
+    # --- public API ---
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def current(self):
+        """Return the in-memory snapshot, reloading from disk only if the files changed"""
+        snap = self._snapshot
+        now = time.monotonic()
+        if snap.stamp is not None and now - self._last_check < self.check_interval:
+            return snap
+        self._last_check = now
+        if self._file_stamp() == snap.stamp:
+            return snap
+        return self.reload()
+
+    def reload(self):
+        with self._lock:
+            stamp = self._file_stamp()
+            if stamp == self._snapshot.stamp:
+                return self._snapshot
+            path = None
+            try:
+                if self.current_path.exists():
+                    path = self.root / self.current_path.read_text(encoding="utf-8").strip()
+                    index, docs, vectors = self._read_generation(path)
+                else:
+                    index, docs, vectors = self._read_legacy()
+            except Exception:
+                # half-written files from another process: keep serving the old snapshot
+                return self._snapshot
+            if self._file_stamp() != stamp:
+                # files changed while we were reading; try again on the next check
+                return self._snapshot
+            rows = index.ntotal if index is not None else (len(vectors) if vectors is not None else len(docs))
+            if rows != len(docs):
+                return self._snapshot
+            return self._swap(index, docs, vectors, stamp, path)
+
+    def publish(self, embeddings, docs):
+        """
+        Write a freshly built index to a new generation directory and swap it in.
+        Queries already running keep using the previous snapshot.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        vids = np.array([doc_vid(d["doc_id"]) for d in docs], dtype=np.int64)
+        if len(set(vids.tolist())) != len(docs):
+            raise ValueError("doc_id values must be unique")
+        order = np.argsort(vids)
+        vids, embeddings = vids[order], np.ascontiguousarray(embeddings[order])
+        index = None
+        if FAISS_AVAILABLE:
+            # flat / HNSW / IVF chosen by catalog size or VECTOR_INDEX_TYPE
+            index = index_factory.build_index(embeddings, vids)
+        with self._write_lock:
+            return self._write(index, ((int(v), docs[i]) for v, i in zip(vids, order)), embeddings)
+
+    def apply(self, remove_ids, embeddings, docs):
+        """
+        Incremental update: drop `remove_ids` and add `docs` with their `embeddings`.
+        Works on a copy of the live index, so only the changed rows get embedded;
+        untouched metadata records are copied as raw bytes.
+        """
+        with self._write_lock:
+            snap = self.current()
+            add_ids = [doc_vid(d["doc_id"]) for d in docs]
+            # re-added ids are removed first so the index never holds duplicates
+            drop = {vid for vid in set(remove_ids) | set(add_ids) if vid in snap.docs}
+            if not drop and not docs:
+                return snap
+            old_ids = np.asarray(snap.docs.ids)
+            keep_rows = np.flatnonzero(~np.isin(old_ids, np.fromiter(drop, dtype=np.int64, count=len(drop))))
+            new_vectors = np.asarray(embeddings, dtype=np.float32) if len(docs) else None
+            ids = np.concatenate([old_ids[keep_rows], np.array(add_ids, dtype=np.int64)])
+            order = np.argsort(ids, kind="stable")
+            ids = ids[order]
+            parts = [decode_vectors(snap.vectors[keep_rows])] if len(keep_rows) else []
+            if new_vectors is not None:
+                parts.append(new_vectors)
+            dim = new_vectors.shape[1] if new_vectors is not None else (snap.vectors.shape[1] if snap.vectors is not None else 0)
+            vectors = np.ascontiguousarray(np.vstack(parts)[order]) if parts else np.zeros((0, dim), dtype=np.float32)
+
+            def records():
+                # untouched rows are copied as raw bytes together with their group key
+                n_keep = len(keep_rows)
+                for j in order:
+                    if j < n_keep:
+                        i = int(keep_rows[j])
+                        yield int(snap.docs.ids[i]), snap.docs.raw(i), snap.docs.group(i)
+                    else:
+                        yield add_ids[j - n_keep], docs[j - n_keep]
+
+            index = rebuild = None
+            if FAISS_AVAILABLE and len(ids):
+                if snap.index is not None and index_factory.supports_remove(snap.index):
+                    # a serialized copy owns its data; clone_index() of a memory-mapped index
+                    # shares the mapped codes, and remove_ids() on it crashes
+                    index = faiss.deserialize_index(faiss.serialize_index(snap.index))
+                    index_factory.tune(index)
+                    if drop:
+                        index.remove_ids(np.fromiter(drop, dtype=np.int64, count=len(drop)))
+                    if len(docs):
+                        index.add_with_ids(np.ascontiguousarray(new_vectors), np.array(add_ids, dtype=np.int64))
+                else:
+                    # graph index (or none yet): rebuild from the stored vectors, nothing is re-embedded
+                    kind = index_factory.index_kind(snap.index) if snap.index is not None else index_factory.choose_index_type(len(ids))
+                    if kind == "hnsw":
+                        # building the graph takes minutes on large catalogs: serve an exact flat
+                        # index right away and swap the graph in once a background thread built it
+                        index = index_factory.build_index(vectors, ids, kind="flat")
+                        rebuild = kind
+                    else:
+                        index = index_factory.build_index(vectors, ids, kind=kind)
+            snap = self._write(index, records(), vectors)
+            if rebuild:
+                self._schedule_rebuild(rebuild)
+            return snap
+
+    def _schedule_rebuild(self, kind):
+        with self._lock:
+            self._rebuild_kind = kind
+            self._rebuild_requests += 1
+            if self._rebuild_thread is None:
+                self._rebuild_thread = threading.Thread(target=self._rebuild, name=f"index-rebuild-{self.root.name}", daemon=True)
+                self._rebuild_thread.start()
+
+    def _rebuild(self):
+        """Build `_rebuild_kind` for the live snapshot; goes again if an edit lands meanwhile"""
+        while True:
+            with self._lock:
+                requests, kind = self._rebuild_requests, self._rebuild_kind
+            snap = self._snapshot
+            if len(snap.docs) and not self._has_kind(snap, kind):
+                try:
+                    vectors = decode_vectors(snap.vectors)
+                    index = index_factory.build_index(vectors, snap.docs.ids, kind=kind)
+                except Exception as e:
+                    traceback.print_exc()
+                    self.rebuild_error = str(e)
+                    with self._lock:
+                        self._rebuild_thread = None
+                    return
+                with self._write_lock:
+                    # only if no edit replaced the snapshot while the graph was being built
+                    if self._snapshot is snap:
+                        self._write(index, ((int(vid), snap.docs.raw(i), snap.docs.group(i)) for i, vid in enumerate(snap.docs.ids)), vectors)
+                        self.rebuild_error = None
+            with self._lock:
+                live = self._snapshot
+                if self._rebuild_requests == requests and (not len(live.docs) or self._has_kind(live, kind)):
+                    self._rebuild_thread = None
+                    return
+
+    @staticmethod
+    def _has_kind(snap, kind):
+        return snap.index is not None and index_factory.index_kind(snap.index) == kind
+
+    def search(self, q_emb, top_k=5):
+        return self.current().search(q_emb, top_k)
+
+    def stats(self):
+        snap = self._snapshot
+        return {
+            "version": snap.version,
+            "documents": len(snap),
+            "faiss": snap.index is not None,
+            "index_type": index_factory.index_kind(snap.index) if snap.index is not None else None,
+            "vector_dtype": str(snap.vectors.dtype) if snap.vectors is not None else None,
+            "generation": snap.path.name if snap.path else None,
+            "rebuilding": self._rebuild_kind if self._rebuild_thread is not None else None,
+            "rebuild_error": self.rebuild_error,
+            "loaded_at": snap.loaded_at,
+        }